@@ -0,0 +1,179 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from influxdb_client import Point
+
+from batch_summary import BATCH_AT_TEMP_C
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Statistik rolling & flag anomali suhu/pH (seluruh mesin sekaligus)
+# =========================
+# Thread pembaca hanya menaruh sampel terbaru tiap mesin ke baris staging (stage);
+# satu tick per siklus menggeser jendela SEMUA mesin dan menghitung statistik dalam
+# satu operasi vektor NumPy (mesin x jendela), tanpa loop Python per mesin.
+#
+# ANOMALY_WINDOW        : panjang jendela rolling (jumlah tick, 60 x 5 detik = 5 menit); 0 = nonaktif
+# ANOMALY_MIN_SAMPLES   : minimal sampel NYATA (bukan NaN) di jendela sebelum flag dievaluasi; tick tanpa
+#                         sampel mesin (putus/timeout) tetap mengisi slot jendela sebagai NaN, jadi setelah
+#                         gangguan statistik dihitung dari lebih sedikit sampel (default setengah jendela)
+# ANOMALY_TEMP_DELTA_C  : temp_divergence jika |rata-rata (temp1 - temp2)| melebihi ini (°C)
+# ANOMALY_RAMP_SLOPE    : slope temp1 (°C/menit) yang dianggap "sedang naik suhu"
+# ANOMALY_STALL_SLOPE   : ramp_stall jika setelah naik suhu |slope temp1| turun di bawah ini (°C/menit)
+# ANOMALY_STALL_MIN_C   : ramp_stall hanya dicek jika rata-rata temp1 di atas ini (°C) ...
+# ANOMALY_STALL_MAX_C   : ... dan di bawah ini (default = BATCH_AT_TEMP_C)
+# ANOMALY_PH_SLOPE      : ph_drift jika |slope pH| melebihi ini (pH/menit)
+ANOMALY_WINDOW       = int(os.getenv("ANOMALY_WINDOW", "60"))
+ANOMALY_MIN_SAMPLES  = int(os.getenv("ANOMALY_MIN_SAMPLES", str(max(ANOMALY_WINDOW // 2, 2))))
+ANOMALY_TEMP_DELTA_C = float(os.getenv("ANOMALY_TEMP_DELTA_C", "5"))
+ANOMALY_RAMP_SLOPE   = float(os.getenv("ANOMALY_RAMP_SLOPE", "0.5"))
+ANOMALY_STALL_SLOPE  = float(os.getenv("ANOMALY_STALL_SLOPE", "0.1"))
+ANOMALY_STALL_MIN_C  = float(os.getenv("ANOMALY_STALL_MIN_C", "40"))
+ANOMALY_STALL_MAX_C  = float(os.getenv("ANOMALY_STALL_MAX_C", str(BATCH_AT_TEMP_C)))
+ANOMALY_PH_SLOPE     = float(os.getenv("ANOMALY_PH_SLOPE", "0.05"))
+
+# Urutan channel di buffer: (channel, mesin, jendela)
+CHANNELS  = ("temp1", "temp2", "ph", "machine_on")
+ANOMALIES = ("temp_divergence", "ramp_stall", "ph_drift")
+
+
+class FleetStats:
+    """Ring buffer (channel x mesin x jendela) + status anomali per mesin."""
+
+    def __init__(self, machine_ids: list, window: int = ANOMALY_WINDOW, min_samples: int = ANOMALY_MIN_SAMPLES):
+        self.machine_ids = list(machine_ids)
+        self.index = {no_mc: i for i, no_mc in enumerate(self.machine_ids)}
+        count = len(self.machine_ids)
+        self.window = window
+        self.min_samples = max(2, min(min_samples, window))
+        self.values = np.full((len(CHANNELS), count, window), np.nan)
+        self.times = np.full(window, np.nan)
+        self.pos = 0
+        self.active = np.zeros((len(ANOMALIES), count), dtype=bool)
+        self.ramping = np.zeros(count, dtype=bool)
+        self.stats = None
+        self._staged = np.full((len(CHANNELS), count), np.nan)
+        self._lock = threading.Lock()
+
+    def stage(self, no_mc, values: dict):
+        """Dipanggil thread pembaca tiap siklus: simpan sampel terbaru mesin ini (nilai mentah dibagi 10)."""
+        i = self.index.get(no_mc)
+        if i is None:
+            return
+        row = (
+            float(values.get("temp1", 0) or 0) / 10.0,
+            float(values.get("temp2", 0) or 0) / 10.0,
+            float(values.get("ph", 0) or 0) / 10.0,
+            1.0 if (values.get("machine_on", 0) or 0) > 0 else 0.0,
+        )
+        with self._lock:
+            self._staged[:, i] = row
+
+    def tick(self, now: float | None = None) -> list[Point]:
+        """Geser jendela semua mesin satu langkah, hitung statistik, return Point transisi anomali."""
+        now = time.time() if now is None else now
+        with self._lock:
+            staged = self._staged
+            self._staged = np.full_like(staged, np.nan)
+
+        # Mesin tanpa sampel baru di tick ini mendapat NaN (tidak ikut dihitung)
+        self.values[:, :, self.pos] = staged
+        self.times[self.pos] = now
+        self.pos = (self.pos + 1) % self.window
+
+        self.stats = stats = self._compute(now)
+        fresh = ~np.isnan(staged[0])
+        return self._update_flags(stats, fresh, now)
+
+    def _compute(self, now: float) -> dict:
+        series = self.values[:3]                          # temp1, temp2, ph: (3, mesin, jendela)
+        valid = ~np.isnan(series[0])                      # satu sampel = semua channel sekaligus
+        n = valid.sum(axis=1)
+        t = np.where(valid, self.times - now, 0.0)        # detik relatif ke tick sekarang
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(valid, series, 0.0).sum(axis=2) / n
+            dev = np.where(valid, series - mean[:, :, None], 0.0)
+            std = np.sqrt((dev * dev).sum(axis=2) / n)
+
+            # Slope least-squares terhadap waktu (per menit)
+            t_mean = t.sum(axis=1) / n
+            t_dev = np.where(valid, t - t_mean[:, None], 0.0)
+            slope = (dev * t_dev).sum(axis=2) / (t_dev * t_dev).sum(axis=1) * 60.0
+
+            delta = np.where(valid, series[0] - series[1], 0.0).sum(axis=1) / n
+
+        latest = self.values[:, :, (self.pos - 1) % self.window]
+        return {
+            "n": n,
+            "mean": mean,
+            "std": std,
+            "slope": slope,
+            "delta": delta,
+            "latest": latest,
+        }
+
+    def _update_flags(self, stats: dict, fresh: np.ndarray, now: float) -> list[Point]:
+        mean, slope = stats["mean"], stats["slope"]
+        is_on = stats["latest"][3] > 0
+        # Flag hanya dievaluasi ulang untuk mesin yang punya sampel baru & cukup sampel nyata di jendela;
+        # selain itu status sebelumnya dipertahankan (tidak ada transisi dari statistik yang terlalu tipis)
+        known = fresh & (stats["n"] >= self.min_samples)
+
+        temp1_mean, temp1_slope = mean[0], slope[0]
+        ramping = is_on & (self.ramping | (temp1_slope > ANOMALY_RAMP_SLOPE)) & (temp1_mean < ANOMALY_STALL_MAX_C)
+        self.ramping = np.where(known, ramping, self.ramping)
+
+        with np.errstate(invalid="ignore"):
+            condition = np.stack((
+                is_on & (np.abs(stats["delta"]) > ANOMALY_TEMP_DELTA_C),
+                self.ramping & (temp1_mean >= ANOMALY_STALL_MIN_C) & (np.abs(temp1_slope) < ANOMALY_STALL_SLOPE),
+                is_on & (np.abs(slope[2]) > ANOMALY_PH_SLOPE),
+            ))
+        changed = known & (condition != self.active)
+        self.active = np.where(known, condition, self.active)
+
+        # Loop Python hanya untuk transisi (jarang), bukan per mesin per siklus
+        points = []
+        for k, i in np.argwhere(changed):
+            points.append(self._point(k, i, stats, now))
+        return points
+
+    def _point(self, k: int, i: int, stats: dict, now: float) -> Point:
+        name = ANOMALIES[k]
+        active = bool(self.active[k, i])
+        metric = {
+            "temp_divergence": stats["delta"][i],
+            "ramp_stall": stats["slope"][0, i],
+            "ph_drift": stats["slope"][2, i],
+        }[name]
+        no_mc = self.machine_ids[i]
+        log.info(f"[MC-{no_mc}] Anomali {name} {'mulai' if active else 'selesai'} "
+                 f"(nilai {metric:.2f}, {int(stats['n'][i])}/{self.window} sampel).")
+        return (
+            Point("anomaly_events")
+            .tag("machine_id", no_mc)
+            .tag("anomaly", name)
+            .field("active", 1 if active else 0)
+            .field("value", round(float(metric), 3))
+            .field("temp1_mean", round(float(stats["mean"][0, i]), 2))
+            .field("temp1_std", round(float(stats["std"][0, i]), 3))
+            .field("temp1_slope", round(float(stats["slope"][0, i]), 3))
+            .field("temp_delta", round(float(stats["delta"][i]), 2))
+            .field("ph_mean", round(float(stats["mean"][2, i]), 2))
+            .field("ph_slope", round(float(stats["slope"][2, i]), 3))
+            .field("samples", int(stats["n"][i]))
+            .time(int(now * 1e9))
+        )
+
+
+def open_fleet_stats(machine_ids: list) -> FleetStats | None:
+    if ANOMALY_WINDOW <= 0:
+        return None
+    log.info(f"[Anomali] Statistik rolling aktif untuk {len(machine_ids)} mesin (jendela {ANOMALY_WINDOW} tick, "
+             f"minimal {ANOMALY_MIN_SAMPLES} sampel).")
+    return FleetStats(machine_ids)
@@ -0,0 +1,125 @@
+import os
+import time
+
+from influxdb_client import Point
+
+# =========================
+# Konfigurasi ringkasan batch
+# =========================
+# Suhu (°C, temp1) yang dianggap "sudah di suhu proses" untuk hitung time_at_temp
+BATCH_AT_TEMP_C = float(os.getenv("BATCH_AT_TEMP_C", "80"))
+# Jeda antar sampel maksimum yang masih dihitung ke time_at_temp / off_time (detik, default 2x interval baca).
+# Sisa jeda yang lebih panjang (karantina slave, jeda tulis HMI, collector mati) masuk ke gap_time_s.
+BATCH_MAX_GAP_S = float(os.getenv("BATCH_MAX_GAP_S", "10"))
+
+
+class BatchAccumulator:
+    """Ringkasan satu batch yang di-update inkremental tiap siklus baca."""
+
+    def __init__(self, batch: str, now: float | None = None):
+        now = time.time() if now is None else now
+        self.batch = batch
+        self.start_ts = now
+        self.last_ts = now
+        self.duration_s = 0.0
+        self.at_temp_s = 0.0
+        self.off_s = 0.0
+        self.gap_s = 0.0
+        self.samples = 0
+        self.temp1_max = None
+        self.temp1_sum = 0.0
+        self.temp2_max = None
+        self.temp2_sum = 0.0
+        self.ph_min = None
+        self.ph_max = None
+        self.steps = 0
+        self.last_step = None
+
+    def update(self, values: dict, now: float | None = None):
+        now = time.time() if now is None else now
+        dt = max(0.0, now - self.last_ts)
+        self.last_ts = now
+        self.duration_s += dt
+        # Satu sampel tidak mewakili jeda panjang tanpa data: hanya BATCH_MAX_GAP_S yang dikreditkan
+        if dt > BATCH_MAX_GAP_S:
+            self.gap_s += dt - BATCH_MAX_GAP_S
+            dt = BATCH_MAX_GAP_S
+
+        # Waktu OFF di dalam batch: statistik suhu/pH hanya dihitung saat mesin ON
+        if values.get("machine_on", 0) <= 0:
+            self.off_s += dt
+            return
+
+        temp1 = float(values.get("temp1", 0)) / 10.0
+        temp2 = float(values.get("temp2", 0)) / 10.0
+        ph = float(values.get("ph", 0)) / 10.0
+
+        self.samples += 1
+        self.temp1_sum += temp1
+        self.temp2_sum += temp2
+        self.temp1_max = temp1 if self.temp1_max is None else max(self.temp1_max, temp1)
+        self.temp2_max = temp2 if self.temp2_max is None else max(self.temp2_max, temp2)
+        self.ph_min = ph if self.ph_min is None else min(self.ph_min, ph)
+        self.ph_max = ph if self.ph_max is None else max(self.ph_max, ph)
+        if temp1 >= BATCH_AT_TEMP_C:
+            self.at_temp_s += dt
+
+        step = values.get("step")
+        if step is not None and step != self.last_step:
+            self.steps += 1
+            self.last_step = step
+
+    def summary(self) -> dict:
+        n = self.samples or 1
+        return {
+            "batch": self.batch,
+            "start": int(self.start_ts),
+            "end": int(self.last_ts),
+            "duration_s": round(self.duration_s, 1),
+            "time_at_temp_s": round(self.at_temp_s, 1),
+            "off_time_s": round(self.off_s, 1),
+            "gap_time_s": round(self.gap_s, 1),
+            "temp1_max": self.temp1_max or 0.0,
+            "temp1_mean": round(self.temp1_sum / n, 2),
+            "temp2_max": self.temp2_max or 0.0,
+            "temp2_mean": round(self.temp2_sum / n, 2),
+            "ph_min": self.ph_min or 0.0,
+            "ph_max": self.ph_max or 0.0,
+            "steps": self.steps,
+        }
+
+    def snapshot(self) -> dict:
+        return dict(vars(self))
+
+    @classmethod
+    def from_snapshot(cls, snap: dict) -> "BatchAccumulator":
+        """Akumulator dari checkpoint (state_store); siklus berikutnya melanjutkan dari last_ts."""
+        acc = cls(snap["batch"], snap["start_ts"])
+        for name, value in snap.items():
+            if hasattr(acc, name):
+                setattr(acc, name, value)
+        return acc
+
+    def to_point(self, no_mc) -> Point:
+        point = Point("batch_summary").tag("machine_id", no_mc)
+        for field, value in self.summary().items():
+            point.field(field, value)
+        return point
+
+
+def track_batch(acc: BatchAccumulator | None, current_values: dict, previous_values: dict,
+                now: float | None = None) -> BatchAccumulator | None:
+    """Mulai akumulator baru saat batch berganti / mesin baru ON, lalu update dengan siklus ini."""
+    batch = str(current_values.get("batch", "") or "").strip()
+    prev_batch = str(previous_values.get("batch", "") or "").strip()
+    is_on = current_values.get("machine_on", 0) > 0
+    was_on = previous_values.get("machine_on", 0) > 0
+
+    if batch and batch != prev_batch:
+        acc = BatchAccumulator(batch, now)
+    elif acc is None and is_on and not was_on:
+        acc = BatchAccumulator(batch, now)
+
+    if acc is not None:
+        acc.update(current_values, now)
+    return acc
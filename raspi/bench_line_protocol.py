@@ -0,0 +1,66 @@
+"""Micro-benchmark: influxdb_client.Point vs LineSerializer untuk shape data per siklus.
+
+Jalankan: python bench_line_protocol.py [jumlah_iterasi]
+"""
+import sys
+import time
+import timeit
+
+from influxdb_client import Point
+
+from line_protocol import LineSerializer
+
+HF_FIELDS = ["temp1", "temp2", "seam_left", "seam_right"]
+MF_FIELDS = [
+    "level", "process", "pattern", "step", "ph",
+    "lit_mpump_hr", "bear_mpump_hr", "seal_mpump_hr", "oil_mpump_hr",
+    "lit_dReelR_hr", "bear_dReelR_hr", "seal_dReelR_hr",
+    "cal_temp1_hr", "cal_temp2_hr", "machine_on", "lit_dReelL_hr", "bear_dReelL_hr", "seal_dReelL_hr",
+]
+
+
+def sample_values(fields: list[str]) -> dict:
+    return {f: float(300 + i * 7) / 10.0 for i, f in enumerate(fields)}
+
+
+def with_point(measurement: str, values: dict, ts_ns: int) -> bytes:
+    point = Point(measurement).tag("machine_id", 12).time(ts_ns)
+    for field, value in values.items():
+        point.field(field, value)
+    return point.to_line_protocol().encode()
+
+
+def with_serializer(line: LineSerializer, values: dict, ts_ns: int) -> bytes:
+    line.begin()
+    for field, value in values.items():
+        line.add_float(field, value)
+    return line.finish(ts_ns)
+
+
+def _sorted_line(raw: bytes) -> tuple:
+    # Point mengurutkan field, serializer tidak; bandingkan per field
+    head, fields, ts = raw.decode().split(" ")
+    return head, sorted(fields.split(",")), ts
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    ts_ns = time.time_ns()
+
+    for name, measurement, fields in (
+        ("high_frequency_data", "high_frequency_data", HF_FIELDS),
+        ("medium_frequency_data", "medium_frequency_data", MF_FIELDS),
+    ):
+        values = sample_values(fields)
+        line = LineSerializer(measurement, {"machine_id": 12})
+        assert _sorted_line(with_point(measurement, values, ts_ns)) == \
+            _sorted_line(with_serializer(line, values, ts_ns)), "output berbeda"
+
+        t_point = timeit.timeit(lambda: with_point(measurement, values, ts_ns), number=number)
+        t_line = timeit.timeit(lambda: with_serializer(line, values, ts_ns), number=number)
+        print(f"{name:<22} {len(fields):>2} field | Point {t_point / number * 1e6:7.2f} us"
+              f" | LineSerializer {t_line / number * 1e6:7.2f} us | {t_point / t_line:4.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Benchmark: pymodbus vs klien minimal (modbus_gateway.TcpEndpoint / modbus_lite.RtuClient).
+
+Keduanya membaca register map yang dipakai sekarang (satu request per register + 7 register
+batch) dari server lokal, supaya yang terukur adalah overhead klien, bukan jaringan/bus:
+  * TCP : server pymodbus di 127.0.0.1, register map machines.json
+  * RTU : pty + simulator dari sim_rs485_fleet.py (tanpa emulasi waktu kabel), register map machines2.json
+Sebelum diukur, frame penuh dari kedua klien dicek sama dengan nilai yang di-seed di server
+(nilai berbeda per alamat & unit, termasuk word >= 0x8000) untuk beberapa unit.
+Dilaporkan waktu per frame (wall) dan CPU thread klien per frame.
+
+Jalankan: python bench_modbus_client.py [jumlah_frame]
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import tty
+
+from pymodbus.client import ModbusSerialClient, ModbusTcpClient
+from pymodbus.datastore import ModbusSequentialDataBlock, ModbusServerContext, ModbusSlaveContext
+from pymodbus.server import StartAsyncTcpServer
+
+from modbus_gateway import TcpEndpoint
+from modbus_lite import RtuClient
+from sim_rs485_fleet import RtuFleetSimulator, SimSlave
+
+TCP_PORT = 15502
+UNITS = (1, 2)
+
+
+def seed_word(unit_id: int, address: int) -> int:
+    """Nilai register unik per (unit, alamat); menangkap salah urutan byte/offset/unit."""
+    return (unit_id * 0x1F31 + address * 0x9E37 + 0x0101) & 0xFFFF
+
+
+def frame_requests(regs: dict) -> list[tuple[int, int]]:
+    requests = [(address, 1) for name, address in regs.items() if name != 'batch']
+    requests.append((regs['batch'], 7))
+    return requests
+
+
+def read_with_pymodbus(client, requests, unit_id: int) -> list[int]:
+    words = []
+    for address, count in requests:
+        resp = client.read_holding_registers(address, count=count, slave=unit_id)
+        if resp.isError():
+            raise ConnectionError(f"Gagal membaca {address}")
+        words.extend(resp.registers)
+    return words
+
+
+def read_with_rtu_lite(client: RtuClient, requests, unit_id: int, words: list) -> list[int]:
+    offset = 0
+    for address, count in requests:
+        if client.read_holding_registers_into(address, count, words, offset, slave=unit_id):
+            raise ConnectionError(f"Gagal membaca {address}")
+        offset += count
+    return words
+
+
+def measure(name: str, fn, number: int) -> float:
+    fn()    # pemanasan (koneksi, cache struct)
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    for _ in range(number):
+        fn()
+    cpu = (time.thread_time() - cpu) / number
+    wall = (time.perf_counter() - wall) / number
+    print(f"  {name:<26} {wall * 1e3:7.2f} ms/frame | CPU klien {cpu * 1e3:6.2f} ms/frame")
+    return cpu
+
+
+def bench_tcp(number: int):
+    with open('machines.json', 'r') as f:
+        regs = json.load(f)[0]['read_registers']
+    requests = frame_requests(regs)
+    # pymodbus 3.9 hanya memakai hr= jika di= juga diberikan (tanpa di semua blok jadi default 0)
+    slaves = {
+        unit: ModbusSlaveContext(di=ModbusSequentialDataBlock(0, [0] * 16),
+                                 hr=ModbusSequentialDataBlock(0, [seed_word(unit, a) for a in range(65536)]))
+        for unit in UNITS
+    }
+    context = ModbusServerContext(slaves=slaves, single=False)
+    threading.Thread(
+        target=lambda: asyncio.run(StartAsyncTcpServer(context=context, address=("127.0.0.1", TCP_PORT))),
+        daemon=True,
+    ).start()
+    time.sleep(1)
+
+    print(f"TCP ({len(requests)} request per frame, machines.json)")
+    client = ModbusTcpClient("127.0.0.1", port=TCP_PORT)
+    client.connect()
+    endpoint = TcpEndpoint("127.0.0.1", TCP_PORT, max_inflight=1)
+    blocks = tuple(requests)
+    words = [0] * sum(count for _, count in requests)
+    for unit in UNITS:
+        # Nilai yang diharapkan diambil dari datastore server (termasuk offset alamat pymodbus)
+        expected = [w for address, count in requests for w in slaves[unit].getValues(3, address, count)]
+        assert len(set(expected)) > 1, "datastore tidak ter-seed"
+        endpoint.read_holding_blocks_into(unit, blocks, words)
+        assert words == expected, f"TcpEndpoint unit {unit}: frame berbeda dari datastore"
+        assert read_with_pymodbus(client, requests, unit) == expected, f"pymodbus unit {unit}: frame berbeda"
+
+    cpu_pymodbus = measure("pymodbus ModbusTcpClient", lambda: read_with_pymodbus(client, requests, 1), number)
+    cpu_lite = measure("TcpEndpoint (lock-step)", lambda: endpoint.read_holding_blocks_into(1, blocks, words), number)
+    print(f"  -> CPU klien {cpu_pymodbus / cpu_lite:.1f}x lebih hemat")
+    client.close()
+    endpoint.close()
+
+
+def bench_rtu(number: int):
+    with open('machines2.json', 'r') as f:
+        regs = json.load(f)[0]['read_registers']
+    requests = frame_requests(regs)
+    master_fd, slave_fd = os.openpty()
+    tty.setraw(slave_fd)
+    port = os.ttyname(slave_fd)
+    # Baud sangat tinggi = waktu kabel ~0, yang terukur overhead klien + pty
+    sim_slaves = {}
+    for unit in UNITS:
+        slave = sim_slaves[unit] = SimSlave(unit, regs, time.time())
+        # Nilai statis ter-seed (tanpa jadwal) supaya frame bisa dibandingkan utuh
+        slave.dynamic = {}
+        for address, count in requests:
+            for a in range(address, address + count):
+                slave.store[a] = seed_word(unit, a)
+    sim = RtuFleetSimulator(master_fd, sim_slaves, baud=100_000_000, latency_s=0)
+    sim.start()
+
+    print(f"RTU ({len(requests)} request per frame, machines2.json)")
+    # Parity N: pty tidak mendukung PARENB
+    client = ModbusSerialClient(port=port, baudrate=115200, parity="N", stopbits=1, bytesize=8, timeout=1.0)
+    client.connect()
+    lite = RtuClient(port, baudrate=115200, parity="N", timeout=1.0)
+    lite.connect()
+    words = [0] * sum(count for _, count in requests)
+    for unit in UNITS:
+        expected = [seed_word(unit, a) for address, count in requests for a in range(address, address + count)]
+        read_with_rtu_lite(lite, requests, unit, words)
+        assert words == expected, f"RtuClient unit {unit}: frame berbeda dari simulator"
+        assert read_with_pymodbus(client, requests, unit) == expected, f"pymodbus unit {unit}: frame berbeda"
+
+    cpu_pymodbus = measure("pymodbus ModbusSerialClient", lambda: read_with_pymodbus(client, requests, 1), number)
+    cpu_lite = measure("RtuClient", lambda: read_with_rtu_lite(lite, requests, 1, words), number)
+    print(f"  -> CPU klien {cpu_pymodbus / cpu_lite:.1f}x lebih hemat")
+    client.close()
+    lite.close()
+    sim.stop()
+    os.close(master_fd)
+    os.close(slave_fd)
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    bench_tcp(number)
+    bench_rtu(number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import logging
+import threading
+import time
+
+import requests
+
+from batch_summary import track_batch
+from downtime_tracker import DowntimeTracker
+from event_rules import changed_fields, compile_rules, fill_influx_action
+from frame_log import replay_frames
+from line_protocol import LineSerializer
+from stage_trace import span
+
+# =========================
+# Pipeline bersama collector TCP (mod_influx.py) & RTU (mod_influx_rtu2.py)
+# =========================
+# Skrip collector hanya berbeda di transport (Modbus TCP gateway vs bus RS-485) dan
+# field yang dibaca. Semua yang terjadi setelah satu frame register terbaca ada di sini:
+# decode, diff -> InfluxDB, downtime, ringkasan batch, rule/event API, statistik rolling,
+# fleet_status, checkpoint, dan mode replay.
+
+
+def decode_registers_to_string(registers: list, swap_bytes: bool = True) -> str:
+    byte_data = bytearray()
+    for reg in registers:
+        high = (reg >> 8) & 0xFF
+        low  = reg & 0xFF
+        if swap_bytes:
+            byte_data.extend([low, high])
+        else:
+            byte_data.extend([high, low])
+    return byte_data.decode('ascii', errors='ignore').strip('\x00').strip()
+
+
+def decode_frame(regs: dict, words: list[int]) -> dict:
+    """Frame mentah (register single-word urutan config + 7 register batch) -> dict nilai per nama."""
+    names = [name for name in regs if name != 'batch']
+    current_values = dict(zip(names, words))
+    # Konversi 7 register batch menjadi satu string
+    current_values['batch'] = decode_registers_to_string(words[len(names):len(names) + 7])
+    return current_values
+
+
+def frame_size(regs: dict) -> int:
+    """Jumlah register satu frame untuk layout read_registers ini."""
+    return len([name for name in regs if name != 'batch']) + 7
+
+
+def pick_batch(cur: dict | None, prev: dict | None) -> str:
+    """Prioritaskan batch dari current, fallback ke previous, else kosong."""
+    for src in (cur or {}, prev or {}):
+        try:
+            v = src.get("batch", "")
+            s = "" if v is None else str(v).strip()
+            if s:
+                return s
+        except Exception:
+            # Kalau ada key aneh/tipe tak terduga, lewati
+            continue
+    return ""  # dua-duanya kosong
+
+
+class CollectorPipeline:
+    """Proses siklus per mesin + thread tick bersama; dikonfigurasi oleh skrip collector.
+
+    Rules diisi lewat set_rules(); frame_recorder, fleet_stats, fleet_status, dan state_store diisi di
+    __main__ skrip (None = fitur nonaktif), sama seperti variabel global sebelumnya.
+    """
+
+    def __init__(self, write_api, bucket: str, high_fields: list[str], medium_fields: list[str],
+                 api_url_batch: str | None, api_trigger_url: str | None,
+                 read_interval: float, log: logging.Logger):
+        self.write_api = write_api
+        self.bucket = bucket
+        self.high_fields = high_fields
+        self.medium_fields = medium_fields
+        self.api_url_batch = api_url_batch
+        self.api_trigger_url = api_trigger_url
+        self.read_interval = read_interval
+        self.log = log
+        self.rules_config = []
+        self.rule_plans = {}        # noMc -> RulePlan, di-compile sekali di set_rules()
+        self.frame_recorder = None  # perekam frame mentah (FRAME_LOG_PATH)
+        self._recorder_lock = threading.Lock()
+        self.fleet_stats = None     # statistik rolling & anomali semua mesin (ANOMALY_WINDOW)
+        self.fleet_status = None    # point fleet_status ringkas semua mesin (FLEET_STATUS_INTERVAL_S)
+        self.state_store = None     # checkpoint state per mesin untuk warm start (STATE_FILE)
+
+    def write(self, record, measurement: str):
+        with span("influx_write", "influx", measurement=measurement):
+            self.write_api.write(bucket=self.bucket, record=record)
+
+    def set_rules(self, rules_config: list[dict], machine_ids: list):
+        """Compile rules untuk semua mesin sekali saat start (ValueError jika config salah)."""
+        self.rule_plans = {no_mc: compile_rules(rules_config, no_mc) for no_mc in machine_ids}
+        self.rules_config = rules_config
+
+    def record_frame(self, no_mc, words: list[int], now: float):
+        """Rekam frame mentah; gagal tulis (disk penuh, EIO) mematikan perekam, bukan siklus telemetri."""
+        recorder = self.frame_recorder
+        if recorder is None:
+            return
+        try:
+            recorder.append(no_mc, words, now)
+        except Exception as e:
+            with self._recorder_lock:
+                if self.frame_recorder is not recorder:
+                    return  # sudah dimatikan oleh thread lain
+                self.frame_recorder = None
+            self.log.error(f"[Frame Log] Gagal menulis {recorder.path}: {e}. Perekam frame dinonaktifkan.")
+            try:
+                recorder.close()
+            except Exception:
+                pass
+
+    # ---------- state per mesin
+    def new_machine_state(self, no_mc) -> dict:
+        tags = {"machine_id": no_mc}
+        return {
+            "previous_values": {},
+            "batch_acc": None,
+            "downtime": DowntimeTracker(no_mc),
+            # Rules sudah di-compile per mesin di set_rules()
+            "rules": self.rule_plans.get(no_mc) or compile_rules(self.rules_config, no_mc),
+            "hmi_writes": [],
+            # Prefix line protocol per measurement, di-compile sekali per mesin
+            "lines": {
+                "high_frequency_data": LineSerializer("high_frequency_data", tags),
+                "medium_frequency_data": LineSerializer("medium_frequency_data", tags),
+            },
+        }
+
+    # ---------- event
+    def send_batch_finish(self, no_mc, state: dict, current_values: dict, previous_values: dict, ts_ns: int):
+        """Simpan Batch saat process FINISH ke SQL SERVER lewat API (+ ringkasan batch)."""
+        log = self.log
+        batch_name = pick_batch(current_values, previous_values)
+        batch_send = {"batch": batch_name}
+        batch_acc = state["batch_acc"]
+        if batch_acc is not None:
+            batch_send["summary"] = batch_acc.summary()
+            try:
+                self.write(batch_acc.to_point(no_mc).time(ts_ns), "batch_summary")
+                log.info(f"[MC-{no_mc}] Ringkasan batch '{batch_acc.batch}' dikirim ke Influx.")
+            except Exception as e:
+                log.warning(f"[MC-{no_mc}] Gagal menulis ringkasan batch: {e}")
+            state["batch_acc"] = None
+
+        try:
+            with span("post_batch_finish", "api"):
+                response = requests.post(self.api_url_batch, json=batch_send, timeout=10)
+            log.info(f"[Sender] Mengirim data batch ke API: {batch_send}")
+            log.info(f"[Sender] Status respon API: {response.status_code}")
+        except requests.exceptions.RequestException as e:
+            log.warning(f"[Sender] Tidak dapat terhubung ke API: {e}")
+
+        try:
+            with span("post_trigger", "api"):
+                requests.post(self.api_trigger_url, timeout=10)
+            log.info(f"[MC-{no_mc}] Pemicu akhir proses berhasil dikirim ke API 2.")
+        except Exception as e:
+            log.warning(f"[MC-{no_mc}] Gagal mengirim pemicu ke API 2: {e}")
+
+    def run_action(self, no_mc, state: dict, action: dict, current_values: dict, previous_values: dict, ts_ns: int):
+        """Jalankan satu action dari rule: tulis Influx, event API, atau antre tulis HMI."""
+        if "influx" in action:
+            measurement = action["influx"]
+            line = state["lines"].get(measurement)
+            if line is None:
+                line = state["lines"][measurement] = LineSerializer(measurement, {"machine_id": no_mc})
+            line.begin()
+            fill_influx_action(line, action, current_values)
+            if line.has_fields:
+                self.write(line.finish(ts_ns), measurement)
+                self.log.info(f"[MC-{no_mc}] {measurement} ({', '.join(action.get('fields', []))}) dikirim.")
+        elif action.get("event") == "batch_finish":
+            self.send_batch_finish(no_mc, state, current_values, previous_values, ts_ns)
+        elif "hmi_write" in action:
+            # Dieksekusi oleh thread pembaca setelah siklus ini (butuh koneksi Modbus)
+            state["hmi_writes"].append((action["hmi_write"]["register"], action["hmi_write"]["value"]))
+        else:
+            self.log.warning(f"[MC-{no_mc}] Action rule tidak dikenal: {action}")
+
+    # ---------- siklus
+    def process_cycle(self, no_mc, state: dict, current_values: dict, now: float):
+        """Diff terhadap siklus sebelumnya, tulis Influx, dan kirim event proses selesai."""
+        previous_values = state["previous_values"]
+        ts_ns = int(now * 1e9)
+        lines = state["lines"]
+
+        # ---------- High frequency (temp/seam)
+        line_hf = lines["high_frequency_data"]
+        line_hf.begin()
+        changed_hf = False
+        is_on  = current_values.get("machine_on", 0) > 0
+        was_on = previous_values.get("machine_on", 0) > 0
+        with span("diff", measurement="high_frequency_data"):
+            for f in self.high_fields:
+                if current_values.get(f) != previous_values.get(f) or (is_on and not was_on):
+                    val_raw = current_values.get(f, 0)
+                    # Suhu dikirim PLC x10
+                    val = float(val_raw) / 10.0 if "temp" in f else float(val_raw)
+                    line_hf.add_float(f, val)
+                    changed_hf = True
+        if changed_hf:
+            self.write(line_hf.finish(ts_ns), "high_frequency_data")
+            self.log.debug(f"[MC-{no_mc}] HF changed -> write Influx")
+
+        # ---------- Medium frequency
+        line_mf = lines["medium_frequency_data"]
+        line_mf.begin()
+        changed_mf = False
+        with span("diff", measurement="medium_frequency_data"):
+            for f in self.medium_fields:
+                if current_values.get(f) != previous_values.get(f):
+                    val_raw = current_values.get(f, 0)
+                    val = float(val_raw) / 10.0 if f == "ph" else float(val_raw)
+                    line_mf.add_float(f, val)
+                    changed_mf = True
+        if changed_mf:
+            self.write(line_mf.finish(ts_ns), "medium_frequency_data")
+            self.log.debug(f"[MC-{no_mc}] MF changed -> write Influx")
+
+        # Interval downtime (START/END/durasi/keterangan) untuk tabel Status OFF;
+        # record yang gagal ditulis tetap di antrean tracker dan dikirim ulang siklus berikutnya
+        downtime = state["downtime"]
+        for record, point_dt in downtime.update(is_on, int(current_values.get("ket_mesin_off", 0) or 0), now):
+            self.write(point_dt, "downtime_intervals")
+            downtime.sent(record)
+            self.log.debug(f"[MC-{no_mc}] Interval downtime dikirim.")
+
+        # Ringkasan batch di-update inkremental tiap siklus
+        state["batch_acc"] = track_batch(state["batch_acc"], current_values, previous_values, now)
+
+        # Event dari rules (konteks siklus, mesin off, maintenance, proses selesai);
+        # hanya rule yang field input-nya berubah di siklus ini yang dievaluasi
+        with span("rules"):
+            changed = changed_fields(current_values, previous_values)
+            actions = state["rules"].evaluate(current_values, previous_values, changed)
+        for action in actions:
+            self.run_action(no_mc, state, action, current_values, previous_values, ts_ns)
+
+        # Sampel suhu/pH untuk statistik rolling; dihitung batch oleh anomaly_stats_thread
+        if self.fleet_stats is not None:
+            self.fleet_stats.stage(no_mc, current_values)
+        if self.fleet_status is not None:
+            self.fleet_status.update(no_mc, current_values, now)
+
+        # current_values dibuat baru tiap siklus dan tidak dimutasi lagi
+        state["previous_values"] = current_values
+
+        # Checkpoint segera setelah event, supaya restart tidak memicu ulang action yang sama;
+        # serialisasi + fsync dikerjakan thread checkpoint, bukan thread pembaca
+        if actions and self.state_store is not None:
+            self.state_store.request_save()
+
+    # ---------- tick bersama semua mesin
+    def anomaly_tick(self, now: float):
+        for point in self.fleet_stats.tick(now):
+            self.write(point, "anomaly_events")
+
+    def fleet_status_tick(self, now: float):
+        self.write(self.fleet_status.to_point(now), "fleet_status")
+
+    def _tick_loop(self, name: str, tick, interval: float):
+        self.log.info(f"[{name}] Thread dimulai.")
+        while True:
+            time.sleep(interval)
+            try:
+                tick(time.time())
+            except Exception as e:
+                self.log.error(f"[{name}] ERROR: {e}")
+
+    def start_tick_thread(self, name: str, thread_name: str, tick, interval: float):
+        """Jalankan tick(now) tiap interval detik di thread daemon; error dicatat, thread tetap jalan."""
+        threading.Thread(target=self._tick_loop, args=(name, tick, interval), name=thread_name, daemon=True).start()
+
+    def start_tick_threads(self, fleet_status_interval: float):
+        """Thread statistik rolling & anomali dan fleet_status (jika aktif)."""
+        if self.fleet_stats is not None:
+            self.start_tick_thread("Anomali", "anomaly-stats", self.anomaly_tick, self.read_interval)
+        if self.fleet_status is not None:
+            self.start_tick_thread("Fleet Status", "fleet-status", self.fleet_status_tick, fleet_status_interval)
+
+    # ---------- replay
+    def replay(self, all_machines: list, path: str, speed: float, fleet_status_interval: float):
+        """Putar ulang frame log lewat pipeline yang sama (tanpa Modbus)."""
+        configs = {mc['noMc']: mc for mc in all_machines}
+        sizes = {no_mc: frame_size(mc['read_registers']) for no_mc, mc in configs.items()}
+        states = {}
+        skipped = {}    # noMc -> jumlah frame yang layout-nya tidak cocok
+        # Tick mengikuti timestamp frame, bukan jam dinding
+        ticks = []
+        if self.fleet_stats is not None:
+            ticks.append([self.anomaly_tick, self.read_interval, None])
+        if self.fleet_status is not None:
+            ticks.append([self.fleet_status_tick, fleet_status_interval, None])
+
+        def handle_frame(ts, no_mc, words):
+            machine_config = configs.get(no_mc)
+            if machine_config is None:
+                return
+            # Frame direkam dengan read_registers lain (machines.json berubah): jangan di-decode ke field yang salah
+            if len(words) != sizes[no_mc]:
+                if no_mc not in skipped:
+                    self.log.warning(f"[Replay MC-{no_mc}] Frame berisi {len(words)} register, layout sekarang "
+                                     f"{sizes[no_mc]}; frame dilewati.")
+                skipped[no_mc] = skipped.get(no_mc, 0) + 1
+                return
+            for tick in ticks:
+                tick_fn, interval, last = tick
+                if last is None:
+                    tick[2] = ts
+                elif ts - last >= interval:
+                    tick_fn(ts)
+                    tick[2] = ts
+            if no_mc not in states:
+                states[no_mc] = self.new_machine_state(no_mc)
+            try:
+                self.process_cycle(no_mc, states[no_mc], decode_frame(machine_config['read_registers'], words), ts)
+                # Tidak ada koneksi HMI saat replay
+                states[no_mc]["hmi_writes"].clear()
+            except Exception as e:
+                self.log.error(f"[Replay MC-{no_mc}] ERROR: {e}")
+
+        replay_frames(path, handle_frame, speed)
+        for no_mc, count in skipped.items():
+            self.log.warning(f"[Replay MC-{no_mc}] {count} frame dilewati karena jumlah register tidak cocok.")
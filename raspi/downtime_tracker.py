@@ -0,0 +1,96 @@
+import os
+import time
+
+from influxdb_client import Point, WritePrecision
+
+# =========================
+# Konfigurasi interval downtime
+# =========================
+# Interval OFF baru dianggap valid setelah bertahan selama ini (sama dengan verifiedWindow di panel 8)
+DOWNTIME_MIN_SECONDS = int(os.getenv("DOWNTIME_MIN_SECONDS", "180"))
+
+
+class DowntimeTracker:
+    """Lacak interval mesin OFF per mesin dan hasilkan record `downtime_intervals`.
+
+    Setiap interval ditulis dengan timestamp = waktu START, jadi marker "open" dan
+    record final (saat mesin ON lagi) jatuh di baris yang sama di InfluxDB.
+
+    Record disimpan di antrean `pending` sampai pemanggil melapor sent(); kalau tulis
+    Influx gagal, record yang sama dikirim ulang di siklus berikutnya, sehingga interval
+    yang sudah ditutup tidak tertinggal sebagai open=1 selamanya.
+    """
+
+    def __init__(self, no_mc):
+        self.no_mc = no_mc
+        self.start_ts = None
+        self.reason = 0
+        self.verified = False
+        self.pending = []   # record belum terkirim: [start_ts, end_ts, reason, closed]
+
+    def snapshot(self) -> dict:
+        return {"start_ts": self.start_ts, "reason": self.reason, "verified": self.verified,
+                "pending": [list(record) for record in self.pending]}
+
+    def restore(self, snap: dict):
+        """Lanjutkan interval OFF yang masih terbuka dari checkpoint (state_store)."""
+        self.start_ts = snap.get("start_ts")
+        self.reason = snap.get("reason", 0)
+        self.verified = snap.get("verified", False)
+        self.pending = [list(record) for record in snap.get("pending", [])]
+
+    def _record(self, now: float, closed: bool):
+        self.pending.append([self.start_ts, now, self.reason, closed])
+
+    def _point(self, record: list) -> Point:
+        start_ts, now, reason, closed = record
+        point = Point("downtime_intervals").tag("machine_id", self.no_mc)
+        point.field("start", int(start_ts))
+        point.field("end", int(now) if closed else 0)
+        point.field("duration_minute", round((now - start_ts) / 60.0, 2))
+        point.field("status_code", int(reason))
+        point.field("open", 0 if closed else 1)
+        return point.time(int(start_ts), WritePrecision.S)
+
+    def _is_verified(self, now: float) -> bool:
+        return self.verified or now - self.start_ts >= DOWNTIME_MIN_SECONDS
+
+    def _open(self, reason: int, now: float):
+        self.start_ts = now
+        self.reason = reason
+        self.verified = False
+
+    def update(self, is_on: bool, reason: int, now: float | None = None) -> list[tuple[list, Point]]:
+        """Panggil tiap siklus; return (record, Point) yang perlu ditulis ke Influx, termasuk
+        record siklus sebelumnya yang belum terkirim. Panggil sent(record) setelah tulis berhasil.
+        """
+        now = time.time() if now is None else now
+        self._advance(is_on, reason, now)
+        return [(record, self._point(record)) for record in self.pending]
+
+    def sent(self, record: list):
+        """Record sudah tertulis di Influx: keluarkan dari antrean."""
+        self.pending.remove(record)
+
+    def _advance(self, is_on: bool, reason: int, now: float):
+        if is_on:
+            # Mesin ON lagi -> tutup interval (hanya kalau sudah terverifikasi)
+            if self.start_ts is not None and self._is_verified(now):
+                self._record(now, closed=True)
+            self.start_ts = None
+            return
+
+        if self.start_ts is None:
+            self._open(reason, now)
+        elif reason != self.reason:
+            if self._is_verified(now):
+                # Keterangan OFF berganti -> tutup interval lama, buka yang baru
+                self._record(now, closed=True)
+                self._open(reason, now)
+            else:
+                # Masih dalam jendela verifikasi, cukup ganti keterangan
+                self.reason = reason
+
+        if not self.verified and self._is_verified(now):
+            self.verified = True
+            self._record(now, closed=False)
@@ -0,0 +1,197 @@
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Rule engine untuk transisi proses & pemicu
+# =========================
+# Satu rule di file rules JSON:
+#   {
+#     "name": "process_finish",
+#     "fields": ["process"],            # field input; rule hanya dievaluasi jika salah satunya berubah
+#     "edge": "rises_to", "value": 305,  # jenis transisi (lihat EDGES)
+#     "when": "machine_on",              # opsional: kondisi tambahan ("machine_on" / "machine_off")
+#     "default": 0,                      # opsional: nilai field yang belum ada (mis. siklus pertama setelah start)
+#     "machines": [1, 6],                # opsional: hanya untuk noMc tertentu
+#     "actions": [{"event": "batch_finish"}]
+#   }
+# Jenis action (dijalankan oleh collector_pipeline.run_action):
+#   {"influx": "<measurement>", "fields": [...] / {field: "str"|"int"|"float"}}
+#   {"event": "batch_finish"}
+#   {"hmi_write": {"register": 100, "value": 1}}
+
+
+def _num(v) -> int:
+    try:
+        return int(v or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+# Tiap edge: (nilai sekarang, nilai sebelumnya, value dari rule) -> bool
+EDGES = {
+    "changed":         lambda cur, prev, value: cur != prev,
+    "changed_nonzero": lambda cur, prev, value: _num(cur) != _num(prev) and _num(cur) > 0,
+    "rises_to":        lambda cur, prev, value: _num(prev) != value and _num(cur) == value,
+    "falls_from":      lambda cur, prev, value: _num(prev) == value and _num(cur) != value,
+    "off_to_on":       lambda cur, prev, value: _num(cur) > 0 and _num(prev) <= 0,
+    "on_to_off":       lambda cur, prev, value: _num(cur) <= 0 and _num(prev) > 0,
+}
+
+CONDITIONS = {
+    "machine_on":  lambda values: _num(values.get("machine_on", 0)) > 0,
+    "machine_off": lambda values: _num(values.get("machine_on", 0)) <= 0,
+}
+
+
+EVENTS = ("batch_finish",)
+FIELD_TYPES = ("str", "int", "float")
+
+
+def _check_action(name: str, action) -> None:
+    if not isinstance(action, dict):
+        raise ValueError(f"Rule '{name}': action {action!r} harus berupa object")
+    if "influx" in action:
+        fields = action.get("fields")
+        if not isinstance(action["influx"], str) or not isinstance(fields, (list, dict)) or not fields:
+            raise ValueError(f"Rule '{name}': action influx butuh nama measurement dan 'fields' (list/dict)")
+        if isinstance(fields, dict):
+            bad = [t for t in fields.values() if t not in FIELD_TYPES]
+            if bad:
+                raise ValueError(f"Rule '{name}': tipe field {bad} tidak dikenal (pilihan: {', '.join(FIELD_TYPES)})")
+    elif "event" in action:
+        if action["event"] not in EVENTS:
+            raise ValueError(f"Rule '{name}': event '{action['event']}' tidak dikenal (pilihan: {', '.join(EVENTS)})")
+    elif "hmi_write" in action:
+        target = action["hmi_write"]
+        if not isinstance(target, dict) or not isinstance(target.get("register"), int) or not isinstance(target.get("value"), int):
+            raise ValueError(f"Rule '{name}': action hmi_write butuh 'register' dan 'value' integer")
+    else:
+        raise ValueError(f"Rule '{name}': jenis action {action!r} tidak dikenal (influx / event / hmi_write)")
+
+
+class Rule:
+    def __init__(self, config: dict, action_ids: list[int]):
+        self.name = config.get("name")
+        if not self.name:
+            raise ValueError(f"Rule tanpa 'name': {config!r}")
+        self.fields = list(config.get("fields") or ([config["field"]] if config.get("field") else []))
+        if not self.fields:
+            raise ValueError(f"Rule '{self.name}': 'fields' kosong")
+        if config.get("edge") not in EDGES:
+            raise ValueError(f"Rule '{self.name}': edge '{config.get('edge')}' tidak dikenal "
+                             f"(pilihan: {', '.join(EDGES)})")
+        self.edge = EDGES[config["edge"]]
+        self.value = config.get("value")
+        self.default = config.get("default")
+        when = config.get("when")
+        if when and when not in CONDITIONS:
+            raise ValueError(f"Rule '{self.name}': when '{when}' tidak dikenal (pilihan: {', '.join(CONDITIONS)})")
+        self.when = CONDITIONS[when] if when else None
+        self.action_ids = action_ids
+
+    def matches(self, current: dict, previous: dict) -> bool:
+        if self.when is not None and not self.when(current):
+            return False
+        default = self.default
+        return any(self.edge(current.get(f, default), previous.get(f, default), self.value) for f in self.fields)
+
+
+class RulePlan:
+    """Rule yang sudah di-compile untuk satu mesin, diindeks per field input."""
+
+    def __init__(self, rules: list[Rule], actions: list[dict]):
+        self.rules = rules
+        self.actions = actions
+        self.by_field = {}
+        for index, rule in enumerate(rules):
+            for field in rule.fields:
+                self.by_field.setdefault(field, []).append(index)
+
+    def evaluate(self, current: dict, previous: dict, changed: set) -> list[dict]:
+        """Return action unik (urut sesuai rule) dari rule yang input-nya berubah dan terpenuhi."""
+        candidates = set()
+        for field in changed:
+            indexes = self.by_field.get(field)
+            if indexes:
+                candidates.update(indexes)
+        if not candidates:
+            return []
+
+        fired = []
+        seen = set()
+        for index in sorted(candidates):
+            rule = self.rules[index]
+            if not rule.matches(current, previous):
+                continue
+            log.debug(f"[Rules] Rule '{rule.name}' terpenuhi.")
+            for action_id in rule.action_ids:
+                if action_id not in seen:
+                    seen.add(action_id)
+                    fired.append(self.actions[action_id])
+        return fired
+
+
+def compile_rules(rules_config: list[dict], no_mc=None) -> RulePlan:
+    """Compile config rules menjadi RulePlan untuk satu mesin (rule dengan 'machines' difilter)."""
+    actions = []
+    action_index = {}
+    rules = []
+    for config in rules_config:
+        machines = config.get("machines")
+        if machines is not None and no_mc not in machines:
+            continue
+        ids = []
+        for action in config.get("actions", []):
+            _check_action(config.get("name"), action)
+            # Action identik dari beberapa rule dijalankan sekali saja per siklus
+            key = json.dumps(action, sort_keys=True)
+            if key not in action_index:
+                action_index[key] = len(actions)
+                actions.append(action)
+            ids.append(action_index[key])
+        rules.append(Rule(config, ids))
+    return RulePlan(rules, actions)
+
+
+def validate_rules(rules_config: list[dict]):
+    """Cek semua rule (termasuk yang dibatasi 'machines'); ValueError dengan pesan jelas jika ada yang salah.
+
+    Dipanggil sekali di __main__ supaya config salah menghentikan skrip saat start,
+    bukan mematikan thread reader satu per satu.
+    """
+    if not isinstance(rules_config, list):
+        raise ValueError("File rules harus berisi list rule")
+    for config in rules_config:
+        if not isinstance(config, dict):
+            raise ValueError(f"Rule {config!r} harus berupa object")
+        compile_rules([dict(config, machines=None)])
+
+
+def load_rules(path: str) -> list[dict]:
+    """Baca & validasi file rules (FileNotFoundError / ValueError jika tidak valid)."""
+    with open(path, 'r') as f:
+        rules_config = json.load(f)
+    validate_rules(rules_config)
+    return rules_config
+
+
+def changed_fields(current: dict, previous: dict) -> set:
+    """Change mask satu siklus: nama field yang nilainya berbeda dari siklus sebelumnya."""
+    return {name for name, value in current.items() if previous.get(name) != value}
+
+
+def fill_influx_action(line, action: dict, values: dict):
+    """Isi LineSerializer dari action {"influx": measurement, "fields": [...] / {field: tipe}}."""
+    fields = action.get("fields", [])
+    items = fields.items() if isinstance(fields, dict) else ((f, None) for f in fields)
+    for field, field_type in items:
+        value = values.get(field, 0)
+        # Tanpa tipe eksplisit: string tetap string, selain itu integer (sama seperti cycle_context_data)
+        if field_type == "str" or (field_type is None and isinstance(value, str)):
+            line.add_str(field, "" if value is None else str(value))
+        elif field_type == "float":
+            line.add_float(field, float(value or 0))
+        else:
+            line.add_int(field, int(value or 0))
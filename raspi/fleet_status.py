@@ -0,0 +1,66 @@
+import logging
+import os
+import threading
+import time
+
+from influxdb_client import Point
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Status ringkas seluruh mesin (dashboard overview pabrik)
+# =========================
+# Satu point `fleet_status` per tick berisi status SEMUA mesin sebagai field berprefix mesin:
+#   mc<noMc>_on, mc<noMc>_process, mc<noMc>_step, mc<noMc>_batch, mc<noMc>_temp1, mc<noMc>_temp2,
+#   mc<noMc>_age_s (detik sejak frame terakhir terbaca), mc<noMc>_stale (1 jika age_s > batas)
+# Panel overview cukup satu query last() untuk seluruh pabrik, bukan satu query per mesin.
+#
+# FLEET_STATUS_INTERVAL_S : interval penulisan point (detik); 0 = nonaktif
+# FLEET_STATUS_STALE_S    : mesin dianggap stale jika tidak ada frame selama ini (detik)
+FLEET_STATUS_INTERVAL_S = float(os.getenv("FLEET_STATUS_INTERVAL_S", "5"))
+FLEET_STATUS_STALE_S    = float(os.getenv("FLEET_STATUS_STALE_S", "30"))
+
+
+class FleetStatus:
+    """Nilai terakhir per mesin; to_point() merangkum semuanya jadi satu point."""
+
+    def __init__(self, machine_ids: list, collector: str, stale_s: float = FLEET_STATUS_STALE_S):
+        self.machine_ids = list(machine_ids)
+        self.collector = collector
+        self.stale_s = stale_s
+        self.started = time.time()
+        self._latest = {}   # noMc -> (timestamp frame, nilai siklus)
+        self._lock = threading.Lock()
+
+    def update(self, no_mc, values: dict, now: float):
+        with self._lock:
+            self._latest[no_mc] = (now, values)
+
+    def to_point(self, now: float) -> Point:
+        with self._lock:
+            latest = dict(self._latest)
+        point = Point("fleet_status").tag("collector", self.collector)
+        for no_mc in self.machine_ids:
+            prefix = f"mc{no_mc}_"
+            seen = latest.get(no_mc)
+            # Mesin yang belum pernah terbaca: hanya umur sejak collector start + stale
+            age = now - (seen[0] if seen is not None else min(self.started, now))
+            point.field(prefix + "age_s", round(max(age, 0.0), 1))
+            point.field(prefix + "stale", 1 if seen is None or age > self.stale_s else 0)
+            if seen is None:
+                continue
+            values = seen[1]
+            point.field(prefix + "on", 1 if values.get("machine_on", 0) > 0 else 0)
+            point.field(prefix + "process", int(values.get("process", 0)))
+            point.field(prefix + "step", int(values.get("step", 0)))
+            point.field(prefix + "batch", str(values.get("batch", "") or ""))
+            point.field(prefix + "temp1", float(values.get("temp1", 0)) / 10.0)
+            point.field(prefix + "temp2", float(values.get("temp2", 0)) / 10.0)
+        return point.time(int(now * 1e9))
+
+
+def open_fleet_status(machine_ids: list, collector: str) -> FleetStatus | None:
+    if FLEET_STATUS_INTERVAL_S <= 0:
+        return None
+    log.info(f"[Fleet Status] Point fleet_status untuk {len(machine_ids)} mesin tiap {FLEET_STATUS_INTERVAL_S:g} detik.")
+    return FleetStatus(machine_ids, collector)
@@ -0,0 +1,93 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Frame log: snapshot register mentah per siklus
+# =========================
+# Format file = deretan record, tanpa header file:
+#   header (12 byte, little-endian): timestamp float64 | noMc uint16 | jumlah register uint16
+#   payload: N x uint16 (little-endian), urutan sama dengan read_registers + 7 register batch
+FRAME_LOG_PATH = os.getenv("FRAME_LOG_PATH", "")   # kosong = recorder nonaktif
+
+FRAME_HEADER = struct.Struct("<dHH")
+_payload_structs = {}
+
+
+def _payload_struct(count: int) -> struct.Struct:
+    s = _payload_structs.get(count)
+    if s is None:
+        s = _payload_structs[count] = struct.Struct(f"<{count}H")
+    return s
+
+
+class FrameRecorder:
+    """Append frame register mentah ke file biner (aman dipanggil dari banyak thread)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "ab")
+        self._lock = threading.Lock()
+
+    def append(self, no_mc: int, words: list[int], ts: float | None = None):
+        ts = time.time() if ts is None else ts
+        record = FRAME_HEADER.pack(ts, no_mc, len(words)) + _payload_struct(len(words)).pack(*words)
+        with self._lock:
+            self._f.write(record)
+            self._f.flush()
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+
+
+def open_recorder_from_env() -> FrameRecorder | None:
+    if not FRAME_LOG_PATH:
+        return None
+    log.info(f"[Frame Log] Merekam frame register ke {FRAME_LOG_PATH}")
+    return FrameRecorder(FRAME_LOG_PATH)
+
+
+def iter_frames(path: str):
+    """Yield (timestamp, noMc, words) dari file frame log via mmap."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset = 0
+            size = len(mm)
+            while offset + FRAME_HEADER.size <= size:
+                ts, no_mc, count = FRAME_HEADER.unpack_from(mm, offset)
+                offset += FRAME_HEADER.size
+                payload = _payload_struct(count)
+                if offset + payload.size > size:
+                    break  # record terakhir terpotong (misal listrik mati saat menulis)
+                yield ts, no_mc, list(payload.unpack_from(mm, offset))
+                offset += payload.size
+
+
+def replay_frames(path: str, handle_frame, speed: float = 1.0):
+    """Putar ulang frame log ke handle_frame(ts, noMc, words).
+
+    speed=1 -> real-time sesuai jarak timestamp asli, speed=0 -> secepat mungkin.
+    """
+    first_ts = None
+    started = time.monotonic()
+    count = 0
+    for ts, no_mc, words in iter_frames(path):
+        if speed > 0:
+            if first_ts is None:
+                first_ts = ts
+            delay = (ts - first_ts) / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        handle_frame(ts, no_mc, words)
+        count += 1
+    elapsed = time.monotonic() - started
+    log.info(f"[Replay] {count} frame diputar ulang dalam {elapsed:.2f} detik.")
+    return count
@@ -0,0 +1,89 @@
+import math
+
+# =========================
+# Serializer line protocol untuk hot path telemetri
+# =========================
+# Pengganti Point(...).tag(...).field(...) untuk data per siklus: prefix measurement + tag
+# di-compile sekali per mesin, lalu tiap siklus hanya field yang berubah + timestamp yang
+# ditambahkan ke buffer yang dipakai ulang. Hasilnya bytes line protocol yang langsung
+# diberikan ke write_api.write(record=...).
+
+_ESCAPE_MEASUREMENT = str.maketrans({',': r'\,', ' ': r'\ ', '\n': r'\n', '\r': r'\r', '\t': r'\t'})
+_ESCAPE_KEY = str.maketrans({',': r'\,', '=': r'\=', ' ': r'\ ', '\n': r'\n', '\r': r'\r', '\t': r'\t'})
+_ESCAPE_STRING = str.maketrans({'"': r'\"', '\\': r'\\'})
+
+
+class LineSerializer:
+    """Satu measurement + tag set tetap (misal high_frequency_data, machine_id=1)."""
+
+    def __init__(self, measurement: str, tags: dict):
+        prefix = measurement.translate(_ESCAPE_MEASUREMENT)
+        for key, value in sorted(tags.items()):
+            tag_value = str(value).translate(_ESCAPE_KEY)
+            if tag_value.endswith('\\'):
+                tag_value += ' '
+            prefix += f",{str(key).translate(_ESCAPE_KEY)}={tag_value}"
+        self.prefix = (prefix + " ").encode()
+        self._keys = {}     # nama field -> b"key=" (cache escape)
+        self._buf = bytearray()
+        self._count = 0
+
+    def _key(self, name: str) -> bytes:
+        key = self._keys.get(name)
+        if key is None:
+            key = self._keys[name] = (name.translate(_ESCAPE_KEY) + "=").encode()
+        return key
+
+    def begin(self):
+        del self._buf[len(self.prefix):]
+        if not self._buf:
+            self._buf += self.prefix
+        self._count = 0
+
+    def _sep(self):
+        if self._count:
+            self._buf += b","
+        self._count += 1
+
+    def add_float(self, name: str, value: float):
+        if not math.isfinite(value):
+            return
+        s = repr(value)
+        if s.endswith(".0"):
+            s = s[:-2]
+        self._sep()
+        self._buf += self._key(name)
+        self._buf += s.encode()
+
+    def add_int(self, name: str, value: int):
+        self._sep()
+        self._buf += self._key(name)
+        self._buf += b"%di" % value
+
+    def add_str(self, name: str, value: str):
+        self._sep()
+        self._buf += self._key(name)
+        self._buf += b'"'
+        self._buf += value.translate(_ESCAPE_STRING).encode()
+        self._buf += b'"'
+
+    def add(self, name: str, value):
+        """Pilih tipe seperti Point.field (bool tidak dipakai di data mesin)."""
+        if isinstance(value, str):
+            self.add_str(name, value)
+        elif isinstance(value, int):
+            self.add_int(name, value)
+        else:
+            self.add_float(name, float(value))
+
+    @property
+    def has_fields(self) -> bool:
+        return self._count > 0
+
+    def finish(self, ts_ns: int | None = None) -> bytes | None:
+        """Tutup baris; return None kalau tidak ada field (tidak perlu ditulis)."""
+        if not self._count:
+            return None
+        if ts_ns is not None:
+            self._buf += b" %d" % ts_ns
+        return bytes(self._buf)
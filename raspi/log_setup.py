@@ -0,0 +1,98 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+# =========================
+# Konfigurasi logging
+# =========================
+# LOG_LEVEL   : level default semua modul (DEBUG/INFO/WARNING/ERROR)
+# LOG_LEVELS  : override per modul, misal "mod_influx_rtu2=DEBUG,slave_health=WARNING"
+# LOG_DEDUP_S : pesan identik dari logger yang sama hanya ditulis sekali per jendela ini
+LOG_LEVEL   = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS  = os.getenv("LOG_LEVELS", "")
+LOG_DEDUP_S = float(os.getenv("LOG_DEDUP_S", "60"))
+LOG_FORMAT  = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+_listener = None
+
+
+class DedupFilter(logging.Filter):
+    """Tahan pesan yang berulang (misal mesin offline error tiap 5 detik).
+
+    Pesan identik (logger + level + teks) lolos sekali per jendela; saat jendela habis,
+    pesan berikutnya diberi keterangan berapa kali pesan itu ditahan.
+    """
+
+    def __init__(self, window_s: float):
+        super().__init__()
+        self.window_s = window_s
+        self._seen = {}     # key -> [ts terakhir ditulis, jumlah ditahan]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # DEBUG sengaja tidak ditahan: kalau sudah dinyalakan berarti memang ingin lihat semua
+        if self.window_s <= 0 or record.levelno < logging.INFO:
+            return True
+        msg = record.getMessage()
+        key = (record.name, record.levelno, msg)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is not None and now - entry[0] < self.window_s:
+                entry[1] += 1
+                return False
+            suppressed = entry[1] if entry is not None else 0
+            self._seen[key] = [now, 0]
+            if len(self._seen) > 2048:
+                # Buang entri yang sudah kedaluwarsa supaya dict tidak tumbuh terus
+                self._seen = {k: v for k, v in self._seen.items() if now - v[0] < self.window_s}
+        if suppressed:
+            record.msg = f"{msg} (diulang {suppressed}x dalam {self.window_s:.0f} detik terakhir)"
+            record.args = None
+        return True
+
+
+def _parse_levels(spec: str) -> dict:
+    levels = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """Pasang handler berbasis queue: thread polling hanya enqueue, I/O dilakukan satu thread listener."""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(DedupFilter(LOG_DEDUP_S))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL.upper())
+    for name, level in _parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
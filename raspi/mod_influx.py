@@ -1,15 +1,26 @@
 
 import os
 import time
+import logging
+import argparse
 import requests
 import threading
 import json
-from pymodbus.client import ModbusTcpClient
 from dotenv import load_dotenv
-from influxdb_client import InfluxDBClient, Point, WriteOptions
+from influxdb_client import InfluxDBClient, WriteOptions
 from influxdb_client.client.write_api import SYNCHRONOUS
+from collector_pipeline import CollectorPipeline, decode_frame
+from frame_log import open_recorder_from_env
+from modbus_gateway import build_endpoints
+from stage_trace import install_from_env as install_trace, span
+from anomaly_stats import open_fleet_stats
+from fleet_status import FLEET_STATUS_INTERVAL_S, open_fleet_status
+from state_store import open_state_store
+from log_setup import setup_logging
+from event_rules import load_rules
 
 load_dotenv()
+log = logging.getLogger("mod_influx")
 #  Konfigurasi InfluxDB 
 INFLUX_URL = os.getenv('INFLUX_URL') 
 INFLUX_TOKEN = os.getenv('INFLUX_TOKEN')
@@ -22,6 +33,7 @@ API_TRIGGER_URL = os.getenv('API_TRIGGER_URL')
 API_URL_STRINGS = os.getenv('API_URL_STRINGS')
 API_URL_STRINGS_CONF = os.getenv('API_URL_STRINGS_CONF')
 CONFIG_FILE = 'machines.json'
+RULES_FILE = 'rules.json'
 API_FETCH_INTERVAL = 10
 READ_INTERVAL_SECONDS = 5
 
@@ -31,22 +43,17 @@ sensor_data_lock = threading.Lock()
 latest_hmi_strings_per_machine = {}
 hmi_data_lock = threading.Lock()
 hmi_write_in_progress = threading.Event()
+endpoints = {}         # (ip, port) -> TcpEndpoint, satu koneksi per gateway/PLC
 
 #  Inisialisasi InfluxDB Client 
 influx_client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
 write_api = influx_client.write_api(write_options=SYNCHRONOUS)
 
-#  Fungsi untuk decode register ke string
-def decode_registers_to_string(registers: list, swap_bytes: bool = True) -> str:
-    byte_data = bytearray()
-    for reg in registers:
-        high_byte = (reg >> 8) & 0xff
-        low_byte = reg & 0xff
-        if swap_bytes:
-            byte_data.extend([low_byte, high_byte])
-        else:
-            byte_data.extend([high_byte, low_byte])
-    return byte_data.decode('ascii', errors='ignore').strip('\x00').strip()
+#  Pipeline diff -> InfluxDB, rule & event (bersama dengan mod_influx_rtu2.py)
+HIGH_FREQ_FIELDS = ["temp1", "temp2", "seam_left", "seam_right"]
+MEDIUM_FREQ_FIELDS = ["level", "process", "pattern", "step", "ph", "lit_mpump_hr", "bear_mpump_hr", "seal_mpump_hr", "oil_mpump_hr", "lit_dReelR_hr", "bear_dReelR_hr", "seal_dReelR_hr", "cal_temp1_hr", "cal_temp2_hr","machine_on"]
+pipeline = CollectorPipeline(write_api, INFLUX_BUCKET, HIGH_FREQ_FIELDS, MEDIUM_FREQ_FIELDS,
+                             API_URL_BATCH, API_TRIGGER_URL, READ_INTERVAL_SECONDS, log)
 
 #  Fungsi untuk encode string ke register
 def encode_string_manually(text: str, swap_bytes: bool = True) -> list[int]:
@@ -59,160 +66,67 @@ def encode_string_manually(text: str, swap_bytes: bool = True) -> list[int]:
         payload.append(register_value)
     return payload
 
+#  Blok baca satu frame: semua register single-word (urutan config) lalu 7 register batch
+def frame_blocks(regs: dict) -> tuple:
+    blocks = [(address, 1) for name, address in regs.items() if name != 'batch']
+    blocks.append((regs['batch'], 7))
+    return tuple(blocks)
+
+#  Fungsi baca satu frame register mentah, dikirim sebagai satu batch pipelined
+def read_machine_frame(endpoint, unit_id: int, blocks: tuple) -> list[int]:
+    words = [0] * sum(count for _, count in blocks)
+    with span("read_frame", "modbus", unit=unit_id, requests=len(blocks)):
+        endpoint.read_holding_blocks_into(unit_id, blocks, words)
+    return words
+
 #  THREAD 1: Pembaca data hmi dan kirim ke InfluxDB
 def machine_monitoring_thread(machine_config: dict):
     no_mc = machine_config['noMc']
-    ip = machine_config['ip_address']
-    port = machine_config['port']
+    unit_id = machine_config.get('unit_id', 1)
     regs = machine_config['read_registers']
-    client = ModbusTcpClient(ip, port=port)
+    endpoint = endpoints[(machine_config['ip_address'], machine_config['port'])]
+    blocks = frame_blocks(regs)
     
-    previous_values = {}
+    state = pipeline.new_machine_state(no_mc)
+    if pipeline.state_store is not None:
+        pipeline.state_store.restore(no_mc, state)
 
-    print(f"[MC-{no_mc}] Thread monitoring dimulai.")
+    log.info(f"[MC-{no_mc}] Thread monitoring dimulai (unit {unit_id} @ {endpoint.host}:{endpoint.port}).")
     while True:
         if hmi_write_in_progress.is_set():
-            print(f"[Sensor Reader MC-{no_mc}] Proses tulis sedang berjalan, pembacaan dijeda.")
+            log.info(f"[Sensor Reader MC-{no_mc}] Proses tulis sedang berjalan, pembacaan dijeda.")
             time.sleep(READ_INTERVAL_SECONDS)
             continue
         try:
-            client.connect()
-            
-            current_values = {}
-            
-            # 1. Baca semua register single-word
-            for name, address in regs.items():
-                if name != 'batch': # Lewati register batch untuk dibaca terpisah
-                    response = client.read_holding_registers(address, count=1, slave=1)
-                    if response.isError(): raise ConnectionError(f"Gagal membaca register '{name}'")
-                    current_values[name] = response.registers[0]
-
-            # 2. Baca 7 register untuk batch secara khusus
-            batch_address = regs['batch']
-            batch_response = client.read_holding_registers(batch_address, count=7, slave=1)
-            if batch_response.isError(): raise ConnectionError("Gagal membaca register 'batch'")
-            # 3. Konversi 7 register tersebut menjadi satu string
-            batch_string = decode_registers_to_string(batch_response.registers)
-            current_values['batch'] = batch_string # Simpan string, bukan angka
-
-     
-            
-            # 1. Data Frekuensi Tinggi (Temp & Seam)
-            high_freq_fields = ["temp1", "temp2", "seam_left", "seam_right"]
-            point_hf = Point("high_frequency_data").tag("machine_id", no_mc)
-            has_new_hf_data = False
-            is_machine_on = current_values.get("machine_on", 0) > 0
-            was_machine_on = previous_values.get("machine_on", 0) > 0
-            for field in high_freq_fields:
-                if current_values.get(field) != previous_values.get(field) or (is_machine_on and not was_machine_on):
-                    # Bagi dengan 10 untuk mendapatkan nilai desimal
-                    value = float(current_values.get(field, 0)) / 10.0 if "temp" in field else float(current_values.get(field, 0))
-                    point_hf.field(field, value)
-                    has_new_hf_data = True
-            if has_new_hf_data:
-                write_api.write(bucket=INFLUX_BUCKET, record=point_hf)
-                print(f"[MC-{no_mc}] Perubahan data frekuensi tinggi terdeteksi dan dikirim.")
-
-            # 2. Data Frekuensi medium
-            medium_freq_fields = ["level", "process", "pattern", "step", "ph", "lit_mpump_hr", "bear_mpump_hr", "seal_mpump_hr", "oil_mpump_hr", "lit_dReelR_hr", "bear_dReelR_hr", "seal_dReelR_hr", "cal_temp1_hr", "cal_temp2_hr","machine_on"]
-            point_mf = Point("medium_frequency_data").tag("machine_id", no_mc)
-            has_new_mf_data = False
-            for field in medium_freq_fields:
-                if current_values.get(field) != previous_values.get(field):
-                    value = float(current_values.get(field, 0)) / 10.0 if "ph" in field else float(current_values.get(field, 0))
-                    point_mf.field(field, value)
-                    has_new_mf_data = True
-            if has_new_mf_data:
-                write_api.write(bucket=INFLUX_BUCKET, record=point_mf)
-                print(f"[MC-{no_mc}] Perubahan data frekuensi sedang terdeteksi dan dikirim.")
-
-            # 3. Data Konteks Siklus (Batch, NIK OP, dll.)
-            is_machine_on = current_values.get("machine_on", 0) > 0
-            was_machine_on = previous_values.get("machine_on", 0) > 0
-            
-            context_fields = ["nik_op", "batch", "celup", "shift"]
-            context_changed = any(current_values.get(f) != previous_values.get(f) for f in context_fields)
-            context_changed_ket = current_values.get("ket_mesin_off", 0) != previous_values.get("ket_mesin_off", 0)
-
-            if (is_machine_on and not was_machine_on) or (is_machine_on and context_changed):
-                point_context = Point("cycle_context_data").tag("machine_id", no_mc)
-                for field in context_fields:
-                    # Kirim sebagai tipe data yang benar (string atau integer)
-                    value = current_values.get(field, 0)
-                    point_context.field(field, str(value) if isinstance(value, str) else int(value))
-                write_api.write(bucket=INFLUX_BUCKET, record=point_context)
-                print(f"[MC-{no_mc}] Data konteks siklus (awal/perubahan) dikirim.")
-                
-            #  Jika mesin baru saja dimatikan, kirim keterangan mesin off
-            elif (not is_machine_on and was_machine_on) or (context_changed_ket and not is_machine_on):
-                point_context = Point("cycle_context_data").tag("machine_id", no_mc)
-                ket_mesin_off = current_values.get("ket_mesin_off", 0)
-                point_context.field("ket_mesin_off", ket_mesin_off)
-                write_api.write(bucket=INFLUX_BUCKET, record=point_context)
-                print(f"[MC-{no_mc}] Data konteks keterangan mesin off dikirim.")
-
-            # 4. Data (Maintenance)
-            current_reset = current_values.get("id_reset", 0)
-            previous_reset = previous_values.get("id_reset", 0)
-            
-            if current_reset != previous_reset and current_reset > 0:
-                point_maint = Point("maintenance_events").tag("machine_id", no_mc)
-                point_maint.field("nik_maintanance", str(current_values.get("nik_maintanance", "")))
-                point_maint.field("id_reset", current_values.get("id_reset", 0))
-                write_api.write(bucket=INFLUX_BUCKET, record=point_maint)
-                print(f"[MC-{no_mc}] Pemicu reset terdeteksi, data maintenance dikirim.")
-
-            # --- 5. Simpan Batch saat process FINISH ke SQL SERVER lewat API ---
-            current_process  = int((current_values or {}).get("process", 0) or 0)
-            previous_process = int((previous_values or {}).get("process", 0) or 0)
-
-            def pick_batch(cur: dict | None, prev: dict | None) -> str:
-                """Prioritaskan batch dari current, fallback ke previous, else kosong."""
-                for src in (cur or {}, prev or {}):
-                    try:
-                        v = src.get("batch", "")
-                        s = "" if v is None else str(v).strip()
-                        if s:
-                            return s
-                    except Exception:
-                        # Kalau ada key aneh/tipe tak terduga, lewati
-                        continue
-                return ""  # dua-duanya kosong
-
-            if previous_process != 305 and current_process == 305:
-                batch_name = pick_batch(current_values, previous_values)
-                batch_send = {"batch": batch_name}
-
-                try:
-                    response = requests.post(API_URL_BATCH, json=batch_send, timeout=10)
-                    print(f"[Sender] Mengirim data batch ke API: {batch_send}")
-                    print(response.status_code)
-                except requests.exceptions.RequestException as e:
-                    print(f"[Sender] Tidak dapat terhubung ke API: {e}")
-
-                try:
-                    requests.post(API_TRIGGER_URL, timeout=10)
-                    print(f"[MC-{no_mc}] Pemicu akhir proses berhasil dikirim ke API 2.")
-                except Exception as e:
-                    print(f"[MC-{no_mc}] Gagal mengirim pemicu ke API 2: {e}")
-
-
-            previous_values = current_values.copy()
+            with span("cycle", machine=no_mc):
+                words = read_machine_frame(endpoint, unit_id, blocks)
+                now = time.time()
+                pipeline.record_frame(no_mc, words, now)
+
+                with span("decode"):
+                    current_values = decode_frame(regs, words)
+                pipeline.process_cycle(no_mc, state, current_values, now)
+
+                # Tulis HMI dari action rule (jika ada)
+                while state["hmi_writes"]:
+                    address, value = state["hmi_writes"].pop(0)
+                    with span("hmi_write", "modbus", register=address):
+                        endpoint.write_register(unit_id, address, value)
+                    log.info(f"[MC-{no_mc}] Rule menulis {value} ke register {address}.")
 
         except Exception as e:
-            print(f"[MC-{no_mc}] Terjadi error: {e}")
+            log.error(f"[MC-{no_mc}] Terjadi error: {e}")
         finally:
-            if client.is_socket_open(): client.close()
             time.sleep(READ_INTERVAL_SECONDS)
 
-
 #  THREAD 3: Pengambil Data String dari API 
 def api_hmi_reader_thread():
     global latest_hmi_strings_per_machine
-    print("[API HMI Reader] Thread dimulai.")
+    log.info("[API HMI Reader] Thread dimulai.")
     while True:
         try:
-            response = requests.get(API_URL_STRINGS, timeout=5)
+            with span("get_hmi_strings", "api"):
+                response = requests.get(API_URL_STRINGS, timeout=5)
             if response.status_code == 200:
                 response_data = response.json()
                 if response_data.get("status"):
@@ -222,19 +136,18 @@ def api_hmi_reader_thread():
                             mc_id_int = int(mc_id_str)
                             latest_hmi_strings_per_machine[mc_id_int] = machine_data
         except Exception as e:
-            print(f"[API HMI Reader] Gagal mengambil data string: {e}")
+            log.warning(f"[API HMI Reader] Gagal mengambil data string: {e}")
         time.sleep(API_FETCH_INTERVAL)
 
 # THREAD 4: Penulis Data ke HMI 
 def hmi_writer_thread(machine_config: dict):
     global latest_hmi_strings_per_machine
     no_mc = machine_config['noMc']
-    ip = machine_config['ip_address']
-    port = machine_config['port']
+    unit_id = machine_config.get('unit_id', 1)
     write_regs = machine_config['write_registers']
-    client = ModbusTcpClient(ip, port=port)
+    endpoint = endpoints[(machine_config['ip_address'], machine_config['port'])]
     
-    print(f"[HMI Writer MC-{no_mc}] Thread dimulai.")
+    log.info(f"[HMI Writer MC-{no_mc}] Thread dimulai.")
     while True:
         data_to_write = None
         with hmi_data_lock:
@@ -245,8 +158,7 @@ def hmi_writer_thread(machine_config: dict):
             hmi_write_in_progress.set()
             write_successful = False
             try:
-                client.connect()
-                print(f"[HMI Writer MC-{no_mc}] Data baru terdeteksi, memproses untuk HMI")
+                log.info(f"[HMI Writer MC-{no_mc}] Data baru terdeteksi, memproses untuk HMI")
                 
                 batches_written_count = 0
                 status_register_addresses = write_regs.get('status_registers', [])
@@ -261,58 +173,91 @@ def hmi_writer_thread(machine_config: dict):
                         string_value = str(data_to_write[batch_key]).ljust(14)
                     
                         payload = encode_string_manually(string_value)
-                        print(f"  Menulis {batch_key} ('{string_value}') ke alamat {data_address}")
-                        client.write_registers(data_address, payload, slave=1)
-                        print(f"Mengatur status ON (1) untuk {batch_key} di alamat {status_address}")
-                        client.write_register(status_address, 1, slave=1)
+                        with span("hmi_write", "modbus", batch=batch_key):
+                            log.debug(f"[HMI Writer MC-{no_mc}] Menulis {batch_key} ('{string_value}') ke alamat {data_address}")
+                            endpoint.write_registers(unit_id, data_address, payload)
+                            log.debug(f"[HMI Writer MC-{no_mc}] Mengatur status ON (1) untuk {batch_key} di alamat {status_address}")
+                            endpoint.write_register(unit_id, status_address, 1)
                         batches_written_count += 1
 
                 if batches_written_count > 0:
-                    print(f"[HMI Writer MC-{no_mc}] {batches_written_count} batch berhasil ditulis.")
+                    log.info(f"[HMI Writer MC-{no_mc}] {batches_written_count} batch berhasil ditulis.")
                     write_successful = True 
                 else:
-                    print(f"[HMI Writer MC-{no_mc}] Status True, tetapi tidak ada data batch valid untuk ditulis.")
+                    log.info(f"[HMI Writer MC-{no_mc}] Status True, tetapi tidak ada data batch valid untuk ditulis.")
                     write_successful = True 
 
             except Exception as e:
-                print(f"[HMI Writer MC-{no_mc}] Gagal menulis ke HMI: {e}")
+                log.error(f"[HMI Writer MC-{no_mc}] Gagal menulis ke HMI: {e}")
             finally:
-                if client.is_socket_open(): client.close()
                 hmi_write_in_progress.clear()
 
             if write_successful:
                 try:
                     URL = f"{API_URL_STRINGS_CONF}/{no_mc}"
-                    print(f"[HMI Writer MC-{no_mc}] Mengirim konfirmasi ke {URL}...")
-                    requests.post(URL, timeout=10)
-                    print(f"[HMI Writer MC-{no_mc}] Konfirmasi berhasil dikirim.")
+                    log.debug(f"[HMI Writer MC-{no_mc}] Mengirim konfirmasi ke {URL}...")
+                    with span("post_confirm", "api", machine=no_mc):
+                        requests.post(URL, timeout=10)
+                    log.info(f"[HMI Writer MC-{no_mc}] Konfirmasi berhasil dikirim.")
                 except Exception as e:
-                    print(f"[HMI Writer MC-{no_mc}] Gagal mengirim konfirmasi: {e}")
+                    log.warning(f"[HMI Writer MC-{no_mc}] Gagal mengirim konfirmasi: {e}")
         
         time.sleep(1)
 
 
 if __name__ == "__main__":
-    print(" Modbus Multi-Master READ-WRITE Start")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replay", metavar="FRAME_LOG", help="putar ulang frame log, tanpa koneksi Modbus")
+    parser.add_argument("--speed", type=float, default=1.0, help="kecepatan replay (1 = real-time, 0 = secepat mungkin)")
+    args = parser.parse_args()
+    setup_logging()
+    install_trace()
+
+    log.info("Modbus Multi-Master READ-WRITE Start")
     
     try:
         with open(CONFIG_FILE, 'r') as f:
             all_machines = json.load(f)
     except FileNotFoundError:
-        print(f"ERROR: File konfigurasi '{CONFIG_FILE}' not found!")
+        log.error(f"ERROR: File konfigurasi '{CONFIG_FILE}' not found!")
         exit()
 
+    try:
+        pipeline.set_rules(load_rules(RULES_FILE), [mc['noMc'] for mc in all_machines])
+    except FileNotFoundError:
+        log.error(f"ERROR: File rules '{RULES_FILE}' not found!")
+        exit(1)
+    except ValueError as e:
+        log.error(f"ERROR: Rules '{RULES_FILE}' tidak valid: {e}")
+        exit(1)
+
+    pipeline.fleet_stats = open_fleet_stats([mc['noMc'] for mc in all_machines])
+    pipeline.fleet_status = open_fleet_status([mc['noMc'] for mc in all_machines], "tcp")
+
+    if args.replay:
+        pipeline.replay(all_machines, args.replay, args.speed, FLEET_STATUS_INTERVAL_S)
+        exit()
+
+    pipeline.frame_recorder = open_recorder_from_env()
+    endpoints = build_endpoints(all_machines)
+    pipeline.state_store = open_state_store("state_tcp.json")
+    if pipeline.state_store is not None:
+        pipeline.state_store.start()
     
-    api_hmi_reader = threading.Thread(target=api_hmi_reader_thread, daemon=True)
+    api_hmi_reader = threading.Thread(target=api_hmi_reader_thread, name="api-hmi-reader", daemon=True)
     api_hmi_reader.start()
 
+    pipeline.start_tick_threads(FLEET_STATUS_INTERVAL_S)
+
     for machine_conf in all_machines:
-        reader_sensor = threading.Thread(target=machine_monitoring_thread, args=(machine_conf,), daemon=True)
-        writer = threading.Thread(target=hmi_writer_thread, args=(machine_conf,), daemon=True)
+        reader_sensor = threading.Thread(target=machine_monitoring_thread, args=(machine_conf,),
+                                         name=f"reader-MC{machine_conf['noMc']}", daemon=True)
+        writer = threading.Thread(target=hmi_writer_thread, args=(machine_conf,),
+                                  name=f"hmi-writer-MC{machine_conf['noMc']}", daemon=True)
         reader_sensor.start()
         writer.start()
 
     try:
         while True: time.sleep(1)
     except KeyboardInterrupt:
-        print("\nProgram dihentikan.")
\ No newline at end of file
+        log.info("Program dihentikan.")
\ No newline at end of file
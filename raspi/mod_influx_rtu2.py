@@ -1,15 +1,29 @@
 import os
 import time
+import logging
+import argparse
 import requests
 import threading
 import json
 from dotenv import load_dotenv
 
 from pymodbus.client import ModbusSerialClient
-from influxdb_client import InfluxDBClient, Point
+from modbus_lite import RtuClient
+from influxdb_client import InfluxDBClient
 from influxdb_client.client.write_api import SYNCHRONOUS
 
+from collector_pipeline import CollectorPipeline, decode_frame
+from frame_log import open_recorder_from_env
+from anomaly_stats import open_fleet_stats
+from fleet_status import FLEET_STATUS_INTERVAL_S, open_fleet_status
+from slave_health import SLAVE_HEALTH_INTERVAL_S, SlaveHealth
+from state_store import open_state_store
+from log_setup import setup_logging
+from stage_trace import install_from_env as install_trace, span
+from event_rules import load_rules
+
 load_dotenv()
+log = logging.getLogger("mod_influx_rtu2")
 
 # =========================
 # Konfigurasi InfluxDB
@@ -32,7 +46,9 @@ API_URL_STRINGS_CONF = os.getenv('API_URL_STRINGS_CONF')  # POST confirm /{no_mc
 # =========================
 SERIAL_PORT = os.getenv("SERIAL_PORT", "/dev/ttyUSB0")
 BAUDRATE    = int(os.getenv("BAUDRATE", "9600"))
+MODBUS_CLIENT = os.getenv("MODBUS_CLIENT", "pymodbus")  # "lite" = klien minimal modbus_lite.RtuClient
 CONFIG_FILE = 'machines2.json'
+RULES_FILE  = 'rules2.json'
 
 # =========================
 # Interval
@@ -40,6 +56,7 @@ CONFIG_FILE = 'machines2.json'
 API_FETCH_INTERVAL   = 10   # detik
 READ_INTERVAL_SECONDS= 5    # detik
 SMALL_READ_GAP       = 0.01 # jeda kecil antar request di bus
+SERIAL_RETRIES       = 3    # retry per request untuk slave yang sehat
 
 # =========================
 # Variabel global
@@ -49,36 +66,37 @@ hmi_data_lock = threading.Lock()
 hmi_write_in_progress = threading.Event()  # optional; reader akan tetap jalan, tapi bisa dipakai untuk jeda kalau diinginkan
 
 # Satu client Modbus untuk semua thread + satu lock bus
-client = ModbusSerialClient(
+client = (RtuClient if MODBUS_CLIENT == "lite" else ModbusSerialClient)(
     port=SERIAL_PORT,
     baudrate=BAUDRATE,
     parity="E",
     stopbits=1,
     bytesize=8,
     timeout=1.0,     
-    retries=3,     
+    retries=SERIAL_RETRIES,
 )
 bus_lock = threading.Lock()
+slave_health = {}  # unit_id -> SlaveHealth (timeout adaptif + karantina slave yang mati)
 
 # InfluxDB
 influx_client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
 write_api = influx_client.write_api(write_options=SYNCHRONOUS)
 
+# Pipeline diff -> InfluxDB, rule & event (bersama dengan mod_influx.py)
+HIGH_FREQ_FIELDS = ["temp1", "temp2", "seam_left", "seam_right"]
+MEDIUM_FREQ_FIELDS = [
+    "level","process","pattern","step","ph",
+    "lit_mpump_hr","bear_mpump_hr","seal_mpump_hr","oil_mpump_hr",
+    "lit_dReelR_hr","bear_dReelR_hr","seal_dReelR_hr",
+    "cal_temp1_hr","cal_temp2_hr","machine_on","lit_dReelL_hr","bear_dReelL_hr","seal_dReelL_hr"
+]
+pipeline = CollectorPipeline(write_api, INFLUX_BUCKET, HIGH_FREQ_FIELDS, MEDIUM_FREQ_FIELDS,
+                             API_URL_BATCH, API_TRIGGER_URL, READ_INTERVAL_SECONDS, log)
+
 
 # =========================
 # Util: String <-> Register
 # =========================
-def decode_registers_to_string(registers: list, swap_bytes: bool = True) -> str:
-    byte_data = bytearray()
-    for reg in registers:
-        high = (reg >> 8) & 0xFF
-        low  = reg & 0xFF
-        if swap_bytes:
-            byte_data.extend([low, high])
-        else:
-            byte_data.extend([high, low])
-    return byte_data.decode('ascii', errors='ignore').strip('\x00').strip()
-
 def encode_string_manually(text: str, swap_bytes: bool = True) -> list[int]:
     if len(text) % 2 != 0:
         text += ' '
@@ -91,6 +109,85 @@ def encode_string_manually(text: str, swap_bytes: bool = True) -> list[int]:
     return payload
 
 
+# =========================
+# Akses bus dengan health tracking per slave
+# =========================
+def get_slave_health(unit_id: int) -> SlaveHealth:
+    health = slave_health.get(unit_id)
+    if health is None:
+        health = slave_health.setdefault(unit_id, SlaveHealth(unit_id))
+    return health
+
+def slave_health_tick(now: float):
+    """Tulis point slave_health (error rate, RTT, timeout, karantina) untuk semua slave yang dikenal."""
+    for health in list(slave_health.values()):
+        pipeline.write(health.to_point(now), "slave_health")
+
+def bus_request(unit_id: int, fn, *args, **kwargs):
+    """Jalankan satu request Modbus di bawah bus_lock dengan timeout & retry sesuai kesehatan slave."""
+    health = get_slave_health(unit_id)
+    with span("bus_lock_wait", "modbus", unit=unit_id):
+        bus_lock.acquire()
+    try:
+        if MODBUS_CLIENT == "lite":
+            client.timeout = health.timeout()
+            client.retries = health.retries(SERIAL_RETRIES)
+        else:
+            client.comm_params.timeout_connect = health.timeout()
+            client.transaction.retries = health.retries(SERIAL_RETRIES)
+        start = time.monotonic()
+        try:
+            with span(fn.__name__, "modbus", unit=unit_id, address=args[0] if args else None):
+                resp = fn(*args, slave=unit_id, **kwargs)
+        except Exception:
+            health.record_failure()
+            raise
+        # Exception response tetap berarti slave hidup dan menjawab
+        health.record_success(time.monotonic() - start)
+    finally:
+        bus_lock.release()
+    return resp
+
+
+# =========================
+# Frame register: baca (decode & proses di collector_pipeline.py)
+# =========================
+def read_machine_frame(no_mc, unit_id: int, regs: dict) -> list[int]:
+    """Baca satu frame mentah: register single-word (urutan config) lalu 7 register batch."""
+    if MODBUS_CLIENT == "lite":
+        return read_machine_frame_into(no_mc, unit_id, regs)
+    words = []
+    # --- Baca semua register single-word (kecuali 'batch')
+    for name, address in regs.items():
+        if name == 'batch':
+            continue
+        resp = bus_request(unit_id, client.read_holding_registers, address, count=1)
+        if hasattr(resp, "isError") and resp.isError():
+            raise ConnectionError(f"Gagal membaca register '{name}' @ {address} (MC-{no_mc})")
+        words.append(resp.registers[0])
+        time.sleep(SMALL_READ_GAP)
+
+    # --- Baca 'batch' 7 register -> 14 chars
+    batch_resp = bus_request(unit_id, client.read_holding_registers, regs['batch'], count=7)
+    if hasattr(batch_resp, "isError") and batch_resp.isError():
+        raise ConnectionError(f"Gagal membaca 'batch' @ {regs['batch']} (MC-{no_mc})")
+    words.extend(batch_resp.registers)
+    return words
+
+def read_machine_frame_into(no_mc, unit_id: int, regs: dict) -> list[int]:
+    """Sama dengan read_machine_frame, tapi RtuClient mem-parse respon langsung ke satu list frame."""
+    names = [name for name in regs if name != 'batch']
+    words = [0] * (len(names) + 7)
+    for offset, name in enumerate(names):
+        if bus_request(unit_id, client.read_holding_registers_into, regs[name], 1, words, offset):
+            raise ConnectionError(f"Gagal membaca register '{name}' @ {regs[name]} (MC-{no_mc})")
+        time.sleep(SMALL_READ_GAP)
+
+    # --- 'batch' 7 register -> 14 chars, langsung ke ekor frame
+    if bus_request(unit_id, client.read_holding_registers_into, regs['batch'], 7, words, len(names)):
+        raise ConnectionError(f"Gagal membaca 'batch' @ {regs['batch']} (MC-{no_mc})")
+    return words
+
 # =========================
 # THREAD 1: Reader per mesin
 # =========================
@@ -99,146 +196,39 @@ def machine_monitoring_thread(machine_config: dict):
     unit_id = machine_config['slave_id']
     regs    = machine_config['read_registers']
 
-    previous_values = {}
-    print(f"[MC-{no_mc}] Thread monitoring dimulai (slave {unit_id}).")
+    state = pipeline.new_machine_state(no_mc)
+    if pipeline.state_store is not None:
+        pipeline.state_store.restore(no_mc, state)
+    health = get_slave_health(unit_id)
+    log.info(f"[MC-{no_mc}] Thread monitoring dimulai (slave {unit_id}).")
 
     while True:
         try:
-            current_values = {}
-
-            # --- Baca semua register single-word (kecuali 'batch')
-            for name, address in regs.items():
-                if name == 'batch':
-                    continue
-                with bus_lock:
-                    resp = client.read_holding_registers(address, count=1, slave=unit_id)
-                if hasattr(resp, "isError") and resp.isError():
-                    raise ConnectionError(f"Gagal membaca register '{name}' @ {address} (MC-{no_mc})")
-                current_values[name] = resp.registers[0]
-                time.sleep(SMALL_READ_GAP)
-
-            # --- Baca 'batch' 7 register -> 14 chars
-            with bus_lock:
-                batch_resp = client.read_holding_registers(regs['batch'], count=7, slave=unit_id)
-            if hasattr(batch_resp, "isError") and batch_resp.isError():
-                raise ConnectionError(f"Gagal membaca 'batch' @ {regs['batch']} (MC-{no_mc})")
-            current_values['batch'] = decode_registers_to_string(batch_resp.registers)
-
-            # ---------- High frequency (temp/seam)
-            high_fields = ["temp1", "temp2", "seam_left", "seam_right"]
-            point_hf = Point("high_frequency_data").tag("machine_id", no_mc)
-            changed_hf = False
-            is_on  = current_values.get("machine_on", 0) > 0
-            was_on = previous_values.get("machine_on", 0) > 0
-            for f in high_fields:
-                if current_values.get(f) != previous_values.get(f) or (is_on and not was_on):
-                    val_raw = current_values.get(f, 0)
-                    if "temp" in f:
-                        val = float(val_raw) / 10.0
-                    else:
-                        val = float(val_raw)
-                    point_hf.field(f, val)
-                    changed_hf = True
-            if changed_hf:
-                write_api.write(bucket=INFLUX_BUCKET, record=point_hf)
-                print(f"[MC-{no_mc}] HF changed -> write Influx")
-
-            # ---------- Medium frequency
-            medium_fields = [
-                "level","process","pattern","step","ph",
-                "lit_mpump_hr","bear_mpump_hr","seal_mpump_hr","oil_mpump_hr",
-                "lit_dReelR_hr","bear_dReelR_hr","seal_dReelR_hr",
-                "cal_temp1_hr","cal_temp2_hr","machine_on","lit_dReelL_hr","bear_dReelL_hr","seal_dReelL_hr"
-            ]
-            point_mf = Point("medium_frequency_data").tag("machine_id", no_mc)
-            changed_mf = False
-            for f in medium_fields:
-                if current_values.get(f) != previous_values.get(f):
-                    val_raw = current_values.get(f, 0)
-                    if f == "ph":
-                        val = float(val_raw) / 10.0
-                    else:
-                        val = float(val_raw)
-                    point_mf.field(f, val)
-                    changed_mf = True
-            if changed_mf:
-                write_api.write(bucket=INFLUX_BUCKET, record=point_mf)
-                print(f"[MC-{no_mc}] MF changed -> write Influx")
-
-            # ---------- CycleContext (on-change saat mesin ON ->OFF atau OFF->ON)
-            is_machine_on = current_values.get("machine_on", 0) > 0
-            was_machine_on = previous_values.get("machine_on", 0) > 0
-
-            is_first_run = not previous_values or previous_values == {}
-
-            context_fields = ["nik_op", "batch", "celup", "shift"]
-            context_changed = any(current_values.get(f) != previous_values.get(f) for f in context_fields)
-            context_changed_ket = current_values.get("ket_mesin_off", 0) != previous_values.get("ket_mesin_off", 0)
-
-            if (is_machine_on and not was_machine_on) or (is_machine_on and context_changed):
-                point_context = Point("cycle_context_data").tag("machine_id", no_mc)
-                for field in context_fields:
-                    v = current_values.get(field, 0)
-                    point_context.field(field, str(v) if isinstance(v, str) else int(v))
-                write_api.write(bucket=INFLUX_BUCKET, record=point_context)
-                print(f"[MC-{no_mc}] Data konteks siklus (awal/perubahan) dikirim.")
-
-            elif (not is_machine_on and (was_machine_on or context_changed_ket or is_first_run)):
-                point_context = Point("cycle_context_data").tag("machine_id", no_mc)
-                ket_mesin_off = current_values.get("ket_mesin_off", 0)
-                point_context.field("ket_mesin_off", ket_mesin_off)
-                write_api.write(bucket=INFLUX_BUCKET, record=point_context)
-                print(f"[MC-{no_mc}] Data konteks keterangan mesin off dikirim.")
-
-
-            # ---------- Maintenance reset 
-            cur_reset  = current_values.get("id_reset", 0)
-            prev_reset = previous_values.get("id_reset", 0)
-            if cur_reset != prev_reset and cur_reset > 0:
-                point_maint = Point("maintenance_events").tag("machine_id", no_mc)
-                point_maint.field("nik_maintanance", str(current_values.get("nik_maintanance", "")))
-                point_maint.field("id_reset", int(cur_reset))
-                write_api.write(bucket=INFLUX_BUCKET, record=point_maint)
-                print(f"[MC-{no_mc}] Maintenance reset event -> write Influx")
-
-            # --- 5. Simpan Batch saat process FINISH ke SQL SERVER lewat API ---
-            current_process  = int((current_values or {}).get("process", 0) or 0)
-            previous_process = int((previous_values or {}).get("process", 0) or 0)
-
-            def pick_batch(cur: dict | None, prev: dict | None) -> str:
-                """Prioritaskan batch dari current, fallback ke previous, else kosong."""
-                for src in (cur or {}, prev or {}):
-                    try:
-                        v = src.get("batch", "")
-                        s = "" if v is None else str(v).strip()
-                        if s:
-                            return s
-                    except Exception:
-                        # Kalau ada key aneh/tipe tak terduga, lewati
-                        continue
-                return ""  # dua-duanya kosong
-
-            if previous_process != 355 and current_process == 355:
-                batch_name = pick_batch(current_values, previous_values)
-                batch_send = {"batch": batch_name}
-
-                try:
-                    response = requests.post(API_URL_BATCH, json=batch_send, timeout=10)
-                    print(f"[Sender] Mengirim data batch ke API: {batch_send}")
-                    print(response.status_code)
-                except requests.exceptions.RequestException as e:
-                    print(f"[Sender] Tidak dapat terhubung ke API: {e}")
-
-                try:
-                    requests.post(API_TRIGGER_URL, timeout=10)
-                    print(f"[MC-{no_mc}] Pemicu akhir proses berhasil dikirim ke API 2.")
-                except Exception as e:
-                    print(f"[MC-{no_mc}] Gagal mengirim pemicu ke API 2: {e}")
-
-            previous_values = current_values
+            # Slave dikarantina: lewati siklus sampai jadwal probe berikutnya
+            if not health.probe_due():
+                continue
+            if health.quarantined:
+                # Probe murah: satu register dulu sebelum baca frame penuh
+                bus_request(unit_id, client.read_holding_registers, regs['machine_on'], count=1)
+
+            with span("cycle", machine=no_mc):
+                with span("read_frame", "modbus", unit=unit_id):
+                    words = read_machine_frame(no_mc, unit_id, regs)
+                now = time.time()
+                pipeline.record_frame(no_mc, words, now)
+
+                with span("decode"):
+                    current_values = decode_frame(regs, words)
+                pipeline.process_cycle(no_mc, state, current_values, now)
+
+                # Tulis HMI dari action rule (jika ada)
+                while state["hmi_writes"]:
+                    address, value = state["hmi_writes"].pop(0)
+                    bus_request(unit_id, client.write_register, address, value)
+                    log.info(f"[MC-{no_mc}] Rule menulis {value} ke register {address}.")
 
         except Exception as e:
-            print(f"[MC-{no_mc}] ERROR: {e}")
+            log.error(f"[MC-{no_mc}] ERROR: {e}")
 
         finally:
             time.sleep(READ_INTERVAL_SECONDS)
@@ -249,10 +239,11 @@ def machine_monitoring_thread(machine_config: dict):
 # ====================================
 def api_hmi_reader_thread():
     global latest_hmi_strings_per_machine
-    print("[API HMI Reader] Thread dimulai.")
+    log.info("[API HMI Reader] Thread dimulai.")
     while True:
         try:
-            resp = requests.get(API_URL_STRINGS, timeout=10)
+            with span("get_hmi_strings", "api"):
+                resp = requests.get(API_URL_STRINGS, timeout=10)
             resp.raise_for_status()
             response_data = resp.json()
             if response_data.get("status"):
@@ -265,7 +256,7 @@ def api_hmi_reader_thread():
                             continue
                         latest_hmi_strings_per_machine[mc_id_int] = machine_data
         except Exception as e:
-            print(f"[API HMI Reader] Gagal mengambil data string: {e}")
+            log.warning(f"[API HMI Reader] Gagal mengambil data string: {e}")
         time.sleep(API_FETCH_INTERVAL)
 
 
@@ -278,8 +269,13 @@ def hmi_writer_thread(machine_config: dict):
     unit_id = machine_config['slave_id']
     write_regs = machine_config['write_registers']
 
-    print(f"[HMI Writer MC-{no_mc}] Thread dimulai.")
+    log.info(f"[HMI Writer MC-{no_mc}] Thread dimulai.")
     while True:
+        # Tunda penulisan selama slave dikarantina, data tetap disimpan untuk dicoba lagi
+        if get_slave_health(unit_id).quarantined:
+            time.sleep(1)
+            continue
+
         data_to_write = None
         with hmi_data_lock:
             if no_mc in latest_hmi_strings_per_machine:
@@ -304,30 +300,31 @@ def hmi_writer_thread(machine_config: dict):
                         data_addr = write_regs['batch_map'][key]
                         stat_addr = status_register_addresses[i-1]
 
-                        with bus_lock:
+                        with span("hmi_write", "modbus", batch=key):
                             # tulis string
-                            client.write_registers(data_addr, payload, slave=unit_id)
+                            bus_request(unit_id, client.write_registers, data_addr, payload)
                             # set status ON
-                            client.write_register(stat_addr, 1, slave=unit_id)
+                            bus_request(unit_id, client.write_register, stat_addr, 1)
 
                         batches_written_count += 1
 
                 if batches_written_count > 0:
-                    print(f"[HMI Writer MC-{no_mc}] {batches_written_count} batch berhasil ditulis.")
+                    log.info(f"[HMI Writer MC-{no_mc}] {batches_written_count} batch berhasil ditulis.")
                 else:
-                    print(f"[HMI Writer MC-{no_mc}] Status True, tapi tidak ada batch valid.")
+                    log.info(f"[HMI Writer MC-{no_mc}] Status True, tapi tidak ada batch valid.")
 
                 # Kirim konfirmasi ke API
                 try:
                     url = f"{API_URL_STRINGS_CONF}/{no_mc}"
-                    r = requests.post(url, timeout=10)
+                    with span("post_confirm", "api", machine=no_mc):
+                        r = requests.post(url, timeout=10)
                     r.raise_for_status()
-                    print(f"[HMI Writer MC-{no_mc}] Konfirmasi sukses -> {url}")
+                    log.info(f"[HMI Writer MC-{no_mc}] Konfirmasi sukses -> {url}")
                 except Exception as e:
-                    print(f"[HMI Writer MC-{no_mc}] Gagal kirim konfirmasi: {e}")
+                    log.warning(f"[HMI Writer MC-{no_mc}] Gagal kirim konfirmasi: {e}")
 
             except Exception as e:
-                print(f"[HMI Writer MC-{no_mc}] ERROR tulis HMI: {e}")
+                log.error(f"[HMI Writer MC-{no_mc}] ERROR tulis HMI: {e}")
             finally:
                 hmi_write_in_progress.clear()
 
@@ -338,32 +335,67 @@ def hmi_writer_thread(machine_config: dict):
 # MAIN
 # =========================
 if __name__ == "__main__":
-    print("Modbus Multi-Slave RS-485: Reader + Writer start")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replay", metavar="FRAME_LOG", help="putar ulang frame log, tanpa koneksi Modbus")
+    parser.add_argument("--speed", type=float, default=1.0, help="kecepatan replay (1 = real-time, 0 = secepat mungkin)")
+    args = parser.parse_args()
+    setup_logging()
+    install_trace()
+
+    log.info("Modbus Multi-Slave RS-485: Reader + Writer start")
 
     # Load konfigurasi mesin
     try:
         with open(CONFIG_FILE, 'r') as f:
             all_machines = json.load(f)
     except FileNotFoundError:
-        print(f"ERROR: File konfigurasi '{CONFIG_FILE}' tidak ditemukan!")
+        log.error(f"ERROR: File konfigurasi '{CONFIG_FILE}' tidak ditemukan!")
         exit(1)
     except json.JSONDecodeError as e:
-        print(f"ERROR: JSON '{CONFIG_FILE}' tidak valid: {e}")
+        log.error(f"ERROR: JSON '{CONFIG_FILE}' tidak valid: {e}")
         exit(1)
 
+    # Load rules event (transisi proses, mesin off, maintenance, ...)
+    try:
+        pipeline.set_rules(load_rules(RULES_FILE), [mc['noMc'] for mc in all_machines])
+    except FileNotFoundError:
+        log.error(f"ERROR: File rules '{RULES_FILE}' tidak ditemukan!")
+        exit(1)
+    except ValueError as e:
+        # Termasuk JSON rusak (JSONDecodeError) dan edge/when/action yang tidak dikenal
+        log.error(f"ERROR: Rules '{RULES_FILE}' tidak valid: {e}")
+        exit(1)
+
+    pipeline.fleet_stats = open_fleet_stats([mc['noMc'] for mc in all_machines])
+    pipeline.fleet_status = open_fleet_status([mc['noMc'] for mc in all_machines], "rtu")
+
+    if args.replay:
+        pipeline.replay(all_machines, args.replay, args.speed, FLEET_STATUS_INTERVAL_S)
+        exit(0)
+
+    pipeline.frame_recorder = open_recorder_from_env()
+    pipeline.state_store = open_state_store("state_rtu.json")
+    if pipeline.state_store is not None:
+        pipeline.state_store.start()
+
     # Connect sekali ke port serial
     if not client.connect():
-        print("Gagal connect ke port RS-485")
+        log.error("Gagal connect ke port RS-485")
         exit(1)
 
     # Start thread API reader (ambil batch strings)
-    t_api = threading.Thread(target=api_hmi_reader_thread, daemon=True)
+    t_api = threading.Thread(target=api_hmi_reader_thread, name="api-hmi-reader", daemon=True)
     t_api.start()
 
+    # Start thread statistik rolling & anomali + fleet_status
+    pipeline.start_tick_threads(FLEET_STATUS_INTERVAL_S)
+    if SLAVE_HEALTH_INTERVAL_S > 0:
+        pipeline.start_tick_thread("Slave Health", "slave-health", slave_health_tick, SLAVE_HEALTH_INTERVAL_S)
+
     # Start thread per mesin: reader + writer
     for mc in all_machines:
-        t_reader = threading.Thread(target=machine_monitoring_thread, args=(mc,), daemon=True)
-        t_writer = threading.Thread(target=hmi_writer_thread, args=(mc,), daemon=True)
+        t_reader = threading.Thread(target=machine_monitoring_thread, args=(mc,), name=f"reader-MC{mc['noMc']}", daemon=True)
+        t_writer = threading.Thread(target=hmi_writer_thread, args=(mc,), name=f"hmi-writer-MC{mc['noMc']}", daemon=True)
         t_reader.start()
         t_writer.start()
 
@@ -371,7 +403,7 @@ if __name__ == "__main__":
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
-        print("\nShutting down...")
+        log.info("Shutting down...")
     finally:
         try:
             client.close()
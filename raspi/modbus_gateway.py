@@ -0,0 +1,197 @@
+import logging
+import os
+import socket
+import struct
+import threading
+
+from modbus_lite import (
+    FC_READ_HOLDING, FC_WRITE_MULTIPLE, FC_WRITE_SINGLE, READ_REQUEST, WRITE_MULTI_HEAD, WRITE_SINGLE,
+    check_write_pdu, parse_read_pdu, register_struct,
+)
+from stage_trace import span
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Endpoint Modbus TCP bersama (gateway TCP-serial / PLC multi-unit)
+# =========================
+# Satu koneksi per (ip, port), dipakai bergantian oleh semua mesin di endpoint tersebut
+# (dibedakan dengan unit_id). Request satu frame dikirim pipelined: hingga max_inflight
+# request dikirim sekaligus dan respon dicocokkan lewat transaction ID MBAP.
+#
+# Per mesin di machines.json (opsional):
+#   "unit_id": 1        -> unit/slave id di belakang gateway (default 1)
+#   "max_inflight": 1   -> jumlah request yang boleh menunggu respon sekaligus.
+#                          1 = lock-step (aman untuk gateway serial yang tidak antre request);
+#                          >1 hanya untuk perangkat yang mendukung beberapa transaksi.
+#                          Jika beberapa mesin satu endpoint berbeda nilai, dipakai yang terkecil.
+TCP_TIMEOUT_S = float(os.getenv("TCP_TIMEOUT_S", "3"))
+
+MBAP = struct.Struct(">HHHB")           # transaction id, protocol id (0), length, unit id
+MAX_ADU = 260
+
+
+class TcpEndpoint:
+    """Satu socket Modbus TCP untuk semua unit di (host, port)."""
+
+    def __init__(self, host: str, port: int, max_inflight: int = 1, timeout: float = TCP_TIMEOUT_S):
+        self.host = host
+        self.port = port
+        self.max_inflight = max(1, max_inflight)
+        self.timeout = timeout
+        self._sock = None
+        self._tid = 0
+        self._lock = threading.Lock()   # satu batch transaksi per waktu di socket ini
+        # Buffer kirim (satu jendela in-flight) & terima, dialokasikan sekali
+        self._tx = bytearray(MAX_ADU * self.max_inflight)
+        self._rx = bytearray(MAX_ADU)
+        self._rx_view = memoryview(self._rx)
+        self._read_plans = {}           # tuple blok -> (PDU request baca, offset tiap blok di out)
+
+    def __repr__(self):
+        return f"TcpEndpoint({self.host}:{self.port}, max_inflight={self.max_inflight})"
+
+    # ---------- koneksi
+    def _connect(self) -> socket.socket:
+        if self._sock is None:
+            with span("connect", "modbus", endpoint=f"{self.host}:{self.port}"):
+                sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._sock = sock
+            log.info(f"[Gateway {self.host}:{self.port}] Terhubung.")
+        return self._sock
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def _next_tid(self) -> int:
+        self._tid = self._tid % 0xFFFF + 1
+        return self._tid
+
+    def _recv_into(self, sock: socket.socket, start: int, size: int):
+        view = self._rx_view
+        got = 0
+        while got < size:
+            n = sock.recv_into(view[start + got:start + size])
+            if not n:
+                raise ConnectionError(f"Koneksi ditutup oleh {self.host}:{self.port}")
+            got += n
+
+    # ---------- transaksi
+    def execute(self, unit_id: int, pdus: list[bytes], on_response):
+        """Kirim beberapa PDU ke satu unit secara pipelined.
+
+        on_response(index, view, pos) dipanggil untuk tiap respon dengan PDU di view[pos:]
+        (view berakhir tepat di akhir PDU menurut length MBAP); view hanya valid selama
+        callback berjalan.
+        """
+        pending = {}    # transaction id -> index request
+        # Mesin lain di gateway yang sama bisa sedang memakai socket
+        with span("endpoint_lock_wait", "modbus", unit=unit_id):
+            self._lock.acquire()
+        try:
+            with span("transact", "modbus", unit=unit_id, requests=len(pdus)):
+                sock = self._connect()
+                tx = self._tx
+                next_index = 0
+                while next_index < len(pdus) or pending:
+                    # Isi jendela in-flight dalam satu sendall
+                    size = 0
+                    while next_index < len(pdus) and len(pending) < self.max_inflight:
+                        tid = self._next_tid()
+                        pdu = pdus[next_index]
+                        MBAP.pack_into(tx, size, tid, 0, len(pdu) + 1, unit_id)
+                        tx[size + MBAP.size:size + MBAP.size + len(pdu)] = pdu
+                        size += MBAP.size + len(pdu)
+                        pending[tid] = next_index
+                        next_index += 1
+                    if size:
+                        sock.sendall(memoryview(tx)[:size])
+
+                    self._recv_into(sock, 0, MBAP.size)
+                    tid, _, length, resp_unit = MBAP.unpack_from(self._rx, 0)
+                    if not 2 <= length <= MAX_ADU - MBAP.size + 1:
+                        raise ConnectionError(f"Panjang MBAP {length} tidak valid")
+                    if resp_unit != unit_id:
+                        # Respon dari unit lain: framing error (gateway salah meneruskan / stream bergeser)
+                        raise ConnectionError(f"Unit respon MBAP {resp_unit} tidak sesuai request (unit {unit_id})")
+                    self._recv_into(sock, MBAP.size, length - 1)
+                    index = pending.pop(tid, None)
+                    if index is None:
+                        # Respon telat dari transaksi yang sudah timeout sebelumnya
+                        log.debug(f"[Gateway {self.host}:{self.port}] Respon tid={tid} diabaikan.")
+                        continue
+                    on_response(index, self._rx_view[:MBAP.size + length - 1], MBAP.size)
+        except (OSError, ConnectionError) as e:
+            # Stream sudah tidak sinkron: putus, koneksi dibuka ulang di request berikutnya
+            self._close()
+            if isinstance(e, TimeoutError) and len(pending) > 1:
+                # Perangkat tidak melayani transaksi paralel: turunkan ke lock-step
+                log.warning(f"[Gateway {self.host}:{self.port}] Timeout saat {len(pending)} request "
+                            f"menunggu, max_inflight diturunkan ke 1.")
+                self.max_inflight = 1
+            raise
+        finally:
+            self._lock.release()
+
+    def read_holding_blocks_into(self, unit_id: int, blocks: tuple, out: list):
+        """Baca blok (alamat, jumlah) holding register secara pipelined ke out (berurutan per blok)."""
+        plan = self._read_plans.get(blocks)
+        if plan is None:
+            # Alamat register tetap per mesin: PDU request cukup dibangun sekali
+            pdus = [READ_REQUEST.pack(FC_READ_HOLDING, address, count) for address, count in blocks]
+            offsets = []
+            offset = 0
+            for _, count in blocks:
+                offsets.append(offset)
+                offset += count
+            plan = self._read_plans[blocks] = (pdus, offsets)
+        pdus, offsets = plan
+        errors = []
+
+        def on_response(index, view, pos):
+            address, count = blocks[index]
+            code = parse_read_pdu(view, pos, count, out, offsets[index])
+            if code:
+                errors.append(f"exception {code} @ {address}")
+
+        self.execute(unit_id, pdus, on_response)
+        if errors:
+            raise ConnectionError(f"Gagal membaca unit {unit_id}: {', '.join(errors)}")
+
+    def _write(self, unit_id: int, fc: int, pdu: bytes):
+        codes = []
+        self.execute(unit_id, [pdu], lambda index, view, pos: codes.append(check_write_pdu(view, pos, fc)))
+        if codes[0]:
+            raise ConnectionError(f"Exception Modbus {codes[0]} dari unit {unit_id} (fc {fc})")
+
+    def write_register(self, unit_id: int, address: int, value: int):
+        self._write(unit_id, FC_WRITE_SINGLE, WRITE_SINGLE.pack(FC_WRITE_SINGLE, address, value))
+
+    def write_registers(self, unit_id: int, address: int, values: list[int]):
+        count = len(values)
+        pdu = WRITE_MULTI_HEAD.pack(FC_WRITE_MULTIPLE, address, count, count * 2) + register_struct(count).pack(*values)
+        self._write(unit_id, FC_WRITE_MULTIPLE, pdu)
+
+
+def build_endpoints(all_machines: list) -> dict:
+    """Satu TcpEndpoint per (ip, port) dari konfigurasi mesin."""
+    inflight = {}
+    for mc in all_machines:
+        key = (mc['ip_address'], mc['port'])
+        value = int(mc.get('max_inflight', 1))
+        inflight[key] = min(inflight.get(key, value), value)
+    endpoints = {key: TcpEndpoint(key[0], key[1], value) for key, value in inflight.items()}
+    for key, endpoint in endpoints.items():
+        units = [mc.get('unit_id', 1) for mc in all_machines if (mc['ip_address'], mc['port']) == key]
+        log.info(f"[Gateway] {endpoint} melayani unit {units}.")
+    return endpoints
@@ -0,0 +1,223 @@
+import logging
+import struct
+import time
+
+import serial
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Klien Modbus minimal (fast path holding register)
+# =========================
+# Hanya function code yang dipakai collector: 0x03 (baca holding), 0x06 & 0x10 (tulis).
+# Frame request dibangun di buffer yang dialokasikan sekali (pack_into), respon di-parse
+# dengan struct.unpack_from langsung dari memoryview ke list milik pemanggil, dan CRC16
+# RTU memakai tabel yang dihitung sekali. Framing TCP (MBAP) ada di modbus_gateway.py
+# dan memakai helper PDU yang sama.
+
+FC_READ_HOLDING = 0x03
+FC_WRITE_SINGLE = 0x06
+FC_WRITE_MULTIPLE = 0x10
+
+READ_REQUEST = struct.Struct(">BHH")        # function code, alamat, jumlah register
+WRITE_SINGLE = struct.Struct(">BHH")        # function code, alamat, nilai
+WRITE_MULTI_HEAD = struct.Struct(">BHHB")   # function code, alamat, jumlah register, jumlah byte
+CRC = struct.Struct("<H")
+
+_register_structs = {}
+
+
+def register_struct(count: int) -> struct.Struct:
+    s = _register_structs.get(count)
+    if s is None:
+        s = _register_structs[count] = struct.Struct(f">{count}H")
+    return s
+
+
+# =========================
+# CRC16 Modbus (tabel)
+# =========================
+def _crc_table() -> list[int]:
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+CRC_TABLE = _crc_table()
+
+
+def crc16(data, length: int | None = None) -> int:
+    table = CRC_TABLE
+    crc = 0xFFFF
+    for b in (data if length is None else data[:length]):
+        crc = (crc >> 8) ^ table[(crc ^ b) & 0xFF]
+    return crc
+
+
+# =========================
+# PDU
+# =========================
+class RegisterResponse:
+    """Respon ringan, kompatibel dengan pemakaian respon pymodbus di collector."""
+
+    __slots__ = ("registers", "exception_code")
+
+    def __init__(self, registers: list | None = None, exception_code: int = 0):
+        self.registers = registers if registers is not None else []
+        self.exception_code = exception_code
+
+    def isError(self) -> bool:
+        return self.exception_code != 0
+
+
+def _check_pdu_size(view, pos: int, size: int):
+    # view berakhir di akhir frame yang benar-benar diterima; tanpa cek ini unpack_from
+    # bisa membaca sisa respon sebelumnya di buffer terima
+    if len(view) - pos < size:
+        raise ConnectionError(f"PDU respon {len(view) - pos} byte, kurang dari {size} byte")
+
+
+def parse_read_pdu(view, pos: int, count: int, out: list, offset: int = 0) -> int:
+    """Parse PDU respon 0x03 di view[pos:] ke out[offset:offset+count].
+
+    Return kode exception Modbus (0 = sukses).
+    """
+    _check_pdu_size(view, pos, 2)
+    fc = view[pos]
+    if fc == FC_READ_HOLDING | 0x80:
+        return view[pos + 1]
+    if fc != FC_READ_HOLDING or view[pos + 1] != count * 2:
+        raise ConnectionError(f"Respon baca tidak valid (fc {fc}, {view[pos + 1]} byte untuk {count} register)")
+    _check_pdu_size(view, pos, 2 + count * 2)
+    out[offset:offset + count] = register_struct(count).unpack_from(view, pos + 2)
+    return 0
+
+
+def check_write_pdu(view, pos: int, fc: int) -> int:
+    """Return kode exception Modbus dari respon tulis (0 = sukses)."""
+    _check_pdu_size(view, pos, 2)
+    if view[pos] == fc | 0x80:
+        return view[pos + 1]
+    if view[pos] != fc:
+        raise ConnectionError(f"Function code respon {view[pos]} tidak sesuai (fc {fc})")
+    # Echo alamat + nilai/jumlah register
+    _check_pdu_size(view, pos, 5)
+    return 0
+
+
+# =========================
+# Klien RTU
+# =========================
+class RtuClient:
+    """Pengganti ModbusSerialClient untuk read_holding_registers / write_register(s).
+
+    Argumen konstruktor & method mengikuti pymodbus supaya bisa dipakai langsung di
+    bus_request; timeout & retries bisa diubah per request lewat atribut.
+    """
+
+    def __init__(self, port: str, baudrate: int = 9600, parity: str = "E", stopbits: int = 1,
+                 bytesize: int = 8, timeout: float = 1.0, retries: int = 3):
+        self.port = port
+        self.baudrate = baudrate
+        self.parity = parity
+        self.stopbits = stopbits
+        self.bytesize = bytesize
+        self.timeout = timeout
+        self.retries = retries
+        self._serial = None
+        # Jeda antar frame 3.5 karakter (minimal 1.75 ms sesuai spesifikasi untuk baud > 19200)
+        self.silent_interval = max(3.5 * 11 / baudrate, 0.00175)
+        self._last_frame_end = 0.0
+        self._tx = bytearray(256)
+        self._tx_view = memoryview(self._tx)
+
+    # ---------- koneksi
+    def connect(self) -> bool:
+        if self._serial is not None:
+            return True
+        try:
+            self._serial = serial.Serial(
+                self.port, baudrate=self.baudrate, parity=self.parity,
+                stopbits=self.stopbits, bytesize=self.bytesize, timeout=self.timeout,
+            )
+        except (serial.SerialException, OSError) as e:
+            log.error(f"[Modbus Lite] Gagal membuka {self.port}: {e}")
+            self._serial = None
+        return self._serial is not None
+
+    def close(self):
+        if self._serial is not None:
+            self._serial.close()
+            self._serial = None
+
+    def is_socket_open(self) -> bool:
+        return self._serial is not None
+
+    # ---------- transaksi
+    def _transact(self, length: int, expected: int) -> memoryview:
+        """Kirim self._tx[:length] (+CRC), return memoryview respon lengkap (termasuk CRC)."""
+        if self._serial is None and not self.connect():
+            raise ConnectionError(f"Port {self.port} tidak terbuka")
+        CRC.pack_into(self._tx, length, crc16(self._tx_view, length))
+        request = self._tx_view[:length + 2]
+        unit_id = self._tx[0]
+        error = None
+        for _ in range(self.retries + 1):
+            ser = self._serial
+            if ser.timeout != self.timeout:
+                ser.timeout = self.timeout   # setter pyserial memanggil tcsetattr, jadi hanya saat berubah
+            wait = self._last_frame_end + self.silent_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            ser.reset_input_buffer()
+            ser.write(request)
+
+            # 5 byte pertama cukup untuk membedakan respon normal vs exception
+            head = ser.read(5)
+            self._last_frame_end = time.monotonic()
+            if len(head) < 5:
+                error = TimeoutError(f"Tidak ada respon dari slave {unit_id}")
+                continue
+            if head[1] & 0x80:
+                frame = head
+            else:
+                frame = head + ser.read(expected - 5)
+                self._last_frame_end = time.monotonic()
+                if len(frame) < expected:
+                    error = TimeoutError(f"Respon slave {unit_id} terpotong ({len(frame)}/{expected} byte)")
+                    continue
+            view = memoryview(frame)
+            if frame[0] != unit_id or crc16(view, len(frame) - 2) != CRC.unpack_from(view, len(frame) - 2)[0]:
+                error = ConnectionError(f"CRC/unit respon slave {unit_id} tidak valid")
+                continue
+            return view
+        raise error
+
+    def read_holding_registers_into(self, address: int, count: int, out: list, offset: int = 0, slave: int = 1) -> int:
+        """Fast path: baca `count` register langsung ke out[offset:]; return kode exception (0 = sukses)."""
+        self._tx[0] = slave
+        READ_REQUEST.pack_into(self._tx, 1, FC_READ_HOLDING, address, count)
+        view = self._transact(6, 5 + count * 2)
+        return parse_read_pdu(view, 1, count, out, offset)
+
+    def read_holding_registers(self, address: int, count: int = 1, slave: int = 1) -> RegisterResponse:
+        registers = [0] * count
+        code = self.read_holding_registers_into(address, count, registers, 0, slave)
+        return RegisterResponse(registers, code)
+
+    def write_register(self, address: int, value: int, slave: int = 1) -> RegisterResponse:
+        self._tx[0] = slave
+        WRITE_SINGLE.pack_into(self._tx, 1, FC_WRITE_SINGLE, address, value)
+        view = self._transact(6, 8)
+        return RegisterResponse(exception_code=check_write_pdu(view, 1, FC_WRITE_SINGLE))
+
+    def write_registers(self, address: int, values: list[int], slave: int = 1) -> RegisterResponse:
+        count = len(values)
+        self._tx[0] = slave
+        WRITE_MULTI_HEAD.pack_into(self._tx, 1, FC_WRITE_MULTIPLE, address, count, count * 2)
+        register_struct(count).pack_into(self._tx, 7, *values)
+        view = self._transact(7 + count * 2, 8)
+        return RegisterResponse(exception_code=check_write_pdu(view, 1, FC_WRITE_MULTIPLE))
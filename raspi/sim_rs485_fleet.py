@@ -0,0 +1,411 @@
+"""Simulator armada RS-485 virtual: uji throughput & kapasitas mod_influx_rtu2.py tanpa rewiring pabrik.
+
+Harness membuat pasangan pseudo-terminal (pty):
+  * sisi master  -> simulator multi-slave Modbus RTU (layout register dari machines2.json,
+                    nilai berubah terjadwal: suhu naik-turun, process/step, pH, mesin ON/OFF)
+  * sisi slave   -> collector RTU apa adanya (client, bus_request, bus_lock, read_machine_frame)
+pty tidak punya baud rate, jadi simulator menahan jawaban selama waktu di kabel
+(karakter x 11 bit / baud, format 8E1) ditambah latensi slave.
+
+Yang dilaporkan per skenario (baud x read plan x jumlah slave):
+  * waktu siklus per slave (baca satu frame penuh, termasuk antre bus_lock), p50/p95
+  * periode sampling nyata per slave (jarak antar awal siklus), rata-rata & p95
+  * utilisasi bus (waktu karakter di kabel / durasi skenario)
+  * waktu tunggu bus_lock (rata-rata & p95)
+  * jumlah slave saat target tidak lagi terpenuhi (p95 periode sampling > --max-period)
+
+Thread reader tidur READ_INTERVAL_SECONDS SETELAH tiap siklus, jadi periode sampling nyata
+= waktu siklus + interval; target default MAX_PERIOD_FACTOR x READ_INTERVAL_SECONDS.
+Durasi skenario perlu mencakup minimal dua siklus per slave.
+
+Read plan:
+  register -> read_machine_frame collector (satu request per register + 7 register batch)
+  block    -> register yang berdekatan digabung jadi blok (maks BLOCK_MAX_GAP celah, 125 register)
+
+Jalankan: python sim_rs485_fleet.py --bauds 9600,19200 --slaves 1,2,4,8,16 --plans register,block --duration 30
+"""
+import argparse
+import importlib
+import json
+import logging
+import math
+import os
+import select
+import struct
+import sys
+import threading
+import time
+import tty
+
+from log_setup import setup_logging
+from modbus_lite import crc16
+
+log = logging.getLogger("sim_rs485_fleet")
+
+CONFIG_FILE = 'machines2.json'
+CHAR_BITS = 11              # start + 8 data + parity genap + stop
+SLAVE_LATENCY_S = 0.005     # waktu proses PLC sebelum menjawab
+BLOCK_MAX_GAP = 16          # celah register maksimum yang masih digabung dalam satu blok
+BLOCK_MAX_COUNT = 125       # batas count function code 0x03
+MAX_PERIOD_FACTOR = 1.5     # target periode sampling default = faktor x READ_INTERVAL_SECONDS
+
+
+# =========================
+# Simulator slave
+# =========================
+def _encode_batch(text: str) -> list[int]:
+    # Sama dengan decode_registers_to_string (byte-swapped), 7 register = 14 karakter
+    raw = text.ljust(14)[:14].encode('ascii')
+    return [raw[i] | (raw[i + 1] << 8) for i in range(0, 14, 2)]
+
+
+class SimSlave:
+    """Satu PLC virtual: register statis + nilai terjadwal berdasarkan waktu."""
+
+    def __init__(self, unit_id: int, regs: dict, started: float):
+        self.unit_id = unit_id
+        self.regs = regs
+        self.started = started
+        self.store = {}
+        for offset, word in enumerate(_encode_batch(f"SIM{unit_id:03d}-B001")):
+            self.store[regs['batch'] + offset] = word
+        self.dynamic = {regs[name]: name for name in ("temp1", "temp2", "process", "step", "ph", "machine_on") if name in regs}
+
+    def value(self, address: int, now: float) -> int:
+        name = self.dynamic.get(address)
+        if name is None:
+            return self.store.get(address, 0)
+        t = now - self.started + self.unit_id * 7   # fase beda per slave
+        if name in ("temp1", "temp2"):
+            # Naik 1 °C/detik dari 30 ke 90 °C lalu tahan, siklus 120 detik
+            temp = min(300 + int(t % 120) * 10, 900)
+            return temp + (3 if name == "temp2" else 0)
+        if name == "process":
+            return 300 + int(t // 60) % 6
+        if name == "step":
+            return int(t // 20) % 30
+        if name == "ph":
+            return 70 + int(5 * math.sin(t / 30))
+        return 0 if int(t) % 300 >= 270 else 1      # machine_on: OFF 30 detik tiap 5 menit
+
+
+class RtuFleetSimulator:
+    """Multi-slave Modbus RTU di sisi master pty (0x03, 0x06, 0x10)."""
+
+    def __init__(self, fd: int, slaves: dict, baud: int, latency_s: float = SLAVE_LATENCY_S):
+        self.fd = fd
+        self.slaves = slaves        # unit_id -> SimSlave
+        self.baud = baud
+        self.latency_s = latency_s
+        self.busy_s = 0.0           # total waktu karakter di kabel
+        self.requests = 0
+        self._buf = bytearray()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=2)
+
+    def reset_counters(self):
+        self.busy_s = 0.0
+        self.requests = 0
+
+    def _wire_time(self, chars: int) -> float:
+        return chars * CHAR_BITS / self.baud
+
+    def _frame_length(self) -> int | None:
+        if len(self._buf) < 2:
+            return None
+        fc = self._buf[1]
+        if fc in (0x03, 0x06):
+            return 8
+        if fc == 0x10:
+            return 9 + self._buf[6] if len(self._buf) >= 7 else None
+        return -1
+
+    def _run(self):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self.fd], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                self._buf += os.read(self.fd, 512)
+            except OSError:
+                return
+            while True:
+                length = self._frame_length()
+                if length is None or len(self._buf) < length:
+                    break
+                if length < 0:
+                    self._buf.clear()   # function code tidak dikenal: buang, tunggu frame berikutnya
+                    break
+                frame = bytes(self._buf[:length])
+                del self._buf[:length]
+                self._handle(frame)
+
+    def _handle(self, frame: bytes):
+        if crc16(frame[:-2]) != struct.unpack_from("<H", frame, len(frame) - 2)[0]:
+            self._buf.clear()
+            return
+        unit_id, fc = frame[0], frame[1]
+        self.requests += 1
+        request_wire = self._wire_time(len(frame))
+        slave = self.slaves.get(unit_id)
+        if slave is None:
+            # Slave tidak ada: bus hanya terpakai untuk request, master menunggu timeout
+            self.busy_s += request_wire
+            return
+
+        now = time.time()
+        if fc == 0x03:
+            address, count = struct.unpack_from(">HH", frame, 2)
+            words = [slave.value(address + i, now) for i in range(count)]
+            body = struct.pack(f">BBB{count}H", unit_id, fc, count * 2, *words)
+        elif fc == 0x06:
+            address, word = struct.unpack_from(">HH", frame, 2)
+            slave.store[address] = word
+            body = frame[:6]
+        else:
+            address, count = struct.unpack_from(">HH", frame, 2)
+            for i, word in enumerate(struct.unpack_from(f">{count}H", frame, 7)):
+                slave.store[address + i] = word
+            body = frame[:6]
+        response = body + struct.pack("<H", crc16(body))
+
+        response_wire = self._wire_time(len(response))
+        self.busy_s += request_wire + response_wire
+        # Request baru "tiba" setelah waktu kabelnya, lalu slave memproses dan mengirim jawaban
+        time.sleep(request_wire + self.latency_s + response_wire)
+        os.write(self.fd, response)
+
+
+# =========================
+# Read plan
+# =========================
+def build_block_plan(regs: dict, max_gap: int = BLOCK_MAX_GAP) -> list[tuple[int, int]]:
+    """Gabungkan alamat register (termasuk 7 register batch) menjadi blok (alamat, count)."""
+    addresses = sorted({a for n, a in regs.items() if n != 'batch'} | {regs['batch'] + i for i in range(7)})
+    blocks = []
+    start = prev = addresses[0]
+    for address in addresses[1:]:
+        if address - prev - 1 > max_gap or address - start + 1 > BLOCK_MAX_COUNT:
+            blocks.append((start, prev - start + 1))
+            start = address
+        prev = address
+    blocks.append((start, prev - start + 1))
+    return blocks
+
+
+def read_frame_blocks(rtu, no_mc, unit_id: int, regs: dict, blocks: list) -> list[int]:
+    """Hasil sama dengan read_machine_frame (urutan config + 7 batch), dibaca per blok."""
+    values = {}
+    for address, count in blocks:
+        resp = rtu.bus_request(unit_id, rtu.client.read_holding_registers, address, count=count)
+        if resp.isError():
+            raise ConnectionError(f"Gagal membaca blok @ {address} (MC-{no_mc})")
+        for i, word in enumerate(resp.registers):
+            values[address + i] = word
+        time.sleep(rtu.SMALL_READ_GAP)
+    words = [values[a] for n, a in regs.items() if n != 'batch']
+    words.extend(values[regs['batch'] + i] for i in range(7))
+    return words
+
+
+# =========================
+# Instrumentasi collector
+# =========================
+class TimedLock:
+    """Pengganti bus_lock yang mencatat lama menunggu tiap acquire."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waits = []
+
+    def acquire(self):
+        start = time.monotonic()
+        self._lock.acquire()
+        self.waits.append(time.monotonic() - start)
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _percentile(values: list, q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def fleet_machines(layouts: list, count: int) -> list[dict]:
+    """Perbanyak layout machines2.json menjadi `count` slave (unit id 1..count)."""
+    machines = []
+    for i in range(count):
+        layout = layouts[i % len(layouts)]
+        machines.append({"noMc": i + 1, "slave_id": i + 1, "read_registers": layout["read_registers"]})
+    return machines
+
+
+def run_scenario(rtu, sim: RtuFleetSimulator, machines: list, plan: str, duration: float, max_period: float) -> dict:
+    """Jalankan thread baca per slave (pola machine_monitoring_thread, tanpa tulis Influx)."""
+    rtu.bus_lock = lock = TimedLock()
+    rtu.slave_health.clear()
+    sim.reset_counters()
+    stop = threading.Event()
+    stats = {mc["noMc"]: {"cycles": [], "starts": [], "errors": 0} for mc in machines}
+
+    def poller(mc):
+        no_mc, unit_id, regs = mc["noMc"], mc["slave_id"], mc["read_registers"]
+        blocks = build_block_plan(regs) if plan == "block" else None
+        entry = stats[no_mc]
+        while not stop.is_set():
+            start = time.monotonic()
+            try:
+                if blocks is None:
+                    words = rtu.read_machine_frame(no_mc, unit_id, regs)
+                else:
+                    words = read_frame_blocks(rtu, no_mc, unit_id, regs, blocks)
+                rtu.decode_frame(regs, words)
+                entry["cycles"].append(time.monotonic() - start)
+                entry["starts"].append(start)
+            except Exception as e:
+                entry["errors"] += 1
+                log.debug(f"[Sim MC-{no_mc}] {e}")
+            stop.wait(rtu.READ_INTERVAL_SECONDS)
+
+    threads = [threading.Thread(target=poller, args=(mc,), daemon=True) for mc in machines]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    stop.wait(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    cycles = [c for s in stats.values() for c in s["cycles"]]
+    periods = [b - a for s in stats.values() for a, b in zip(s["starts"], s["starts"][1:])]
+    return {
+        "slaves": len(machines),
+        "frames": len(cycles),
+        "errors": sum(s["errors"] for s in stats.values()),
+        "cycle_p50": _percentile(cycles, 0.5),
+        "cycle_p95": _percentile(cycles, 0.95),
+        "period_mean": sum(periods) / len(periods) if periods else float("nan"),
+        "period_p95": _percentile(periods, 0.95),
+        "bus_util": sim.busy_s / elapsed,
+        "lock_wait_mean_ms": sum(lock.waits) / len(lock.waits) * 1e3 if lock.waits else 0.0,
+        "lock_wait_p95_ms": _percentile(lock.waits, 0.95) * 1e3,
+        # Dinilai dari periode sampling nyata (awal siklus ke awal siklus), bukan waktu siklus saja
+        "met": bool(periods) and _percentile(periods, 0.95) <= max_period,
+    }
+
+
+def open_collector(port: str, baud: int, interval: float | None, modbus_client: str):
+    """Import (ulang) mod_influx_rtu2 dengan SERIAL_PORT/BAUDRATE/MODBUS_CLIENT mengarah ke pty."""
+    os.environ["SERIAL_PORT"] = port
+    os.environ["BAUDRATE"] = str(baud)
+    os.environ["MODBUS_CLIENT"] = modbus_client
+    # Harness tidak menulis ke Influx, tapi modul membuat client saat import
+    os.environ.setdefault("INFLUX_URL", "http://localhost:8086")
+    rtu = sys.modules.get("mod_influx_rtu2")
+    if rtu is not None:
+        rtu.client.close()
+        rtu = importlib.reload(rtu)
+    else:
+        rtu = importlib.import_module("mod_influx_rtu2")
+    if interval is not None:
+        rtu.READ_INTERVAL_SECONDS = interval
+    # pty tidak punya parity dan sebagian kernel menolak PARENB (EINVAL); waktu kabel tetap dihitung 8E1
+    if rtu.MODBUS_CLIENT == "lite":
+        rtu.client.parity = "N"
+    else:
+        rtu.client.comm_params.parity = "N"
+    if not rtu.client.connect():
+        raise ConnectionError(f"Gagal membuka {port}")
+    return rtu
+
+
+def _int_list(text: str) -> list[int]:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulator armada RS-485 virtual untuk mod_influx_rtu2.py")
+    parser.add_argument("--bauds", default="9600,19200", help="daftar baud rate, pisahkan dengan koma")
+    parser.add_argument("--slaves", default="1,2,4,8,16", help="daftar jumlah slave, pisahkan dengan koma")
+    parser.add_argument("--plans", default="register,block", help="read plan: register, block")
+    parser.add_argument("--duration", type=float, default=30.0, help="durasi tiap skenario (detik)")
+    parser.add_argument("--interval", type=float, default=None, help="override READ_INTERVAL_SECONDS")
+    parser.add_argument("--max-period", type=float, default=None,
+                        help=f"target periode sampling p95 (detik); default {MAX_PERIOD_FACTOR:g} x READ_INTERVAL_SECONDS")
+    parser.add_argument("--latency", type=float, default=SLAVE_LATENCY_S, help="latensi jawab slave (detik)")
+    parser.add_argument("--client", default=os.getenv("MODBUS_CLIENT", "pymodbus"), help="klien collector: pymodbus / lite")
+    parser.add_argument("--all", action="store_true", help="tetap jalankan jumlah slave berikutnya setelah target terlewati")
+    args = parser.parse_args()
+    setup_logging()
+
+    with open(CONFIG_FILE, 'r') as f:
+        layouts = json.load(f)
+
+    master_fd, slave_fd = os.openpty()
+    tty.setraw(slave_fd)
+    port = os.ttyname(slave_fd)
+    slave_counts = sorted(_int_list(args.slaves))
+    machines_max = fleet_machines(layouts, slave_counts[-1])
+    started = time.time()
+    slaves = {mc["slave_id"]: SimSlave(mc["slave_id"], mc["read_registers"], started) for mc in machines_max}
+
+    limits = []
+    max_period = None
+    for baud in _int_list(args.bauds):
+        sim = RtuFleetSimulator(master_fd, slaves, baud, args.latency)
+        sim.start()
+        rtu = open_collector(port, baud, args.interval, args.client)
+        if max_period is None:
+            max_period = args.max_period or MAX_PERIOD_FACTOR * rtu.READ_INTERVAL_SECONDS
+            print(f"Target: p95 periode sampling (awal siklus ke awal siklus = siklus + jeda "
+                  f"{rtu.READ_INTERVAL_SECONDS:g} detik) <= {max_period:g} detik")
+            print(f"{'baud':>6} {'plan':<9} {'slave':>5} {'frame':>6} {'err':>4} {'siklus p50':>10} {'p95':>7}"
+                  f" {'periode':>8} {'p95':>7} {'bus':>6} {'lock avg':>9} {'p95':>8}  target")
+        try:
+            for plan in args.plans.split(","):
+                limit = None
+                for count in slave_counts:
+                    r = run_scenario(rtu, sim, fleet_machines(layouts, count), plan, args.duration, max_period)
+                    print(f"{baud:>6} {plan:<9} {r['slaves']:>5} {r['frames']:>6} {r['errors']:>4}"
+                          f" {r['cycle_p50']:>9.3f}s {r['cycle_p95']:>6.3f}s {r['period_mean']:>7.2f}s {r['period_p95']:>6.2f}s"
+                          f" {r['bus_util'] * 100:>5.1f}% {r['lock_wait_mean_ms']:>7.1f}ms {r['lock_wait_p95_ms']:>6.1f}ms"
+                          f"  {'OK' if r['met'] else 'TERLEWATI'}", flush=True)
+                    if not r["met"] and limit is None:
+                        limit = count
+                        if not args.all:
+                            break
+                limits.append((baud, plan, limit))
+        finally:
+            rtu.client.close()
+            sim.stop()
+
+    print()
+    for baud, plan, limit in limits:
+        if limit is None:
+            print(f"{baud} baud / {plan}: periode sampling <= {max_period:g} detik terpenuhi sampai {slave_counts[-1]} slave")
+        else:
+            print(f"{baud} baud / {plan}: periode sampling {max_period:g} detik tidak terpenuhi mulai {limit} slave")
+    os.close(master_fd)
+    os.close(slave_fd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import logging
+import os
+import time
+
+from influxdb_client import Point
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Konfigurasi kesehatan slave RS-485
+# =========================
+HEALTH_FAIL_THRESHOLD = int(os.getenv("HEALTH_FAIL_THRESHOLD", "3"))        # gagal beruntun -> karantina
+QUARANTINE_BASE_S     = float(os.getenv("QUARANTINE_BASE_S", "30"))         # jeda probe pertama
+QUARANTINE_MAX_S      = float(os.getenv("QUARANTINE_MAX_S", "600"))         # jeda probe maksimum
+TIMEOUT_MIN_S         = float(os.getenv("TIMEOUT_MIN_S", "0.15"))
+TIMEOUT_MAX_S         = float(os.getenv("TIMEOUT_MAX_S", "1.0"))
+TIMEOUT_RTT_FACTOR    = 4.0    # timeout = faktor x rata-rata waktu respon slave
+EWMA_ALPHA            = 0.2
+# Interval point `slave_health` per slave ke InfluxDB (detik); 0 = nonaktif
+SLAVE_HEALTH_INTERVAL_S = float(os.getenv("SLAVE_HEALTH_INTERVAL_S", "60"))
+
+
+class SlaveHealth:
+    """Status kesehatan satu slave Modbus di bus bersama (dipanggil saat memegang bus_lock)."""
+
+    def __init__(self, unit_id: int):
+        self.unit_id = unit_id
+        self.consecutive_failures = 0
+        self.last_success_ts = None
+        self.requests = 0
+        self.errors = 0
+        self.error_rate = 0.0
+        self.rtt_avg = None
+        self.quarantined = False
+        self.backoff_s = QUARANTINE_BASE_S
+        self.next_probe_ts = 0.0
+
+    def timeout(self) -> float:
+        """Timeout per request, menyesuaikan waktu respon yang teramati."""
+        if self.rtt_avg is None:
+            return TIMEOUT_MAX_S
+        base = max(TIMEOUT_MIN_S, self.rtt_avg * TIMEOUT_RTT_FACTOR)
+        # Setelah gagal, timeout dilonggarkan bertahap (slave mungkin sedang lambat)
+        return min(TIMEOUT_MAX_S, base * 2 ** min(self.consecutive_failures, 3))
+
+    def retries(self, default: int) -> int:
+        # Slave yang sedang bermasalah tidak diberi retry supaya tidak menahan bus
+        return 0 if self.consecutive_failures else default
+
+    def probe_due(self, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        return not self.quarantined or now >= self.next_probe_ts
+
+    def record_success(self, rtt: float, now: float | None = None):
+        now = time.time() if now is None else now
+        self.requests += 1
+        self.error_rate = (1 - EWMA_ALPHA) * self.error_rate
+        self.rtt_avg = rtt if self.rtt_avg is None else (1 - EWMA_ALPHA) * self.rtt_avg + EWMA_ALPHA * rtt
+        self.consecutive_failures = 0
+        self.last_success_ts = now
+        if self.quarantined:
+            self.quarantined = False
+            self.backoff_s = QUARANTINE_BASE_S
+            log.info(f"[Bus] Slave {self.unit_id} merespon lagi, keluar dari karantina "
+                     f"(error rate {self.error_rate:.2f}, RTT {rtt * 1000:.1f} ms).")
+
+    def record_failure(self, now: float | None = None):
+        now = time.time() if now is None else now
+        self.requests += 1
+        self.errors += 1
+        self.error_rate = (1 - EWMA_ALPHA) * self.error_rate + EWMA_ALPHA
+        self.consecutive_failures += 1
+        if self.quarantined:
+            # Probe gagal -> perpanjang jeda (exponential backoff)
+            self.backoff_s = min(QUARANTINE_MAX_S, self.backoff_s * 2)
+            self.next_probe_ts = now + self.backoff_s
+        elif self.consecutive_failures >= HEALTH_FAIL_THRESHOLD:
+            self.quarantined = True
+            self.next_probe_ts = now + self.backoff_s
+            last_ok = "belum pernah" if self.last_success_ts is None else f"{now - self.last_success_ts:.0f} detik lalu"
+            log.warning(f"[Bus] Slave {self.unit_id} gagal {self.consecutive_failures}x berturut-turut, "
+                        f"dikarantina (probe lagi {self.backoff_s:.0f} detik; error rate {self.error_rate:.2f}, "
+                        f"sukses terakhir {last_ok}).")
+
+    def snapshot(self) -> dict:
+        return {
+            "unit_id": self.unit_id,
+            "requests": self.requests,
+            "errors": self.errors,
+            "consecutive_failures": self.consecutive_failures,
+            "last_success_ts": self.last_success_ts,
+            "error_rate": round(self.error_rate, 3),
+            "rtt_avg_ms": round(self.rtt_avg * 1000, 1) if self.rtt_avg is not None else None,
+            "timeout_s": round(self.timeout(), 3),
+            "quarantined": self.quarantined,
+        }
+
+    def to_point(self, now: float | None = None) -> Point:
+        """Point `slave_health` (tag unit_id) dari snapshot() untuk dashboard kesehatan bus."""
+        now = time.time() if now is None else now
+        snap = self.snapshot()
+        point = Point("slave_health").tag("unit_id", self.unit_id)
+        point.field("requests", snap["requests"])
+        point.field("errors", snap["errors"])
+        point.field("consecutive_failures", snap["consecutive_failures"])
+        point.field("error_rate", float(snap["error_rate"]))
+        point.field("timeout_s", float(snap["timeout_s"]))
+        point.field("quarantined", 1 if snap["quarantined"] else 0)
+        if snap["rtt_avg_ms"] is not None:
+            point.field("rtt_avg_ms", float(snap["rtt_avg_ms"]))
+        if snap["last_success_ts"] is not None:
+            point.field("last_success_age_s", round(now - snap["last_success_ts"], 1))
+        return point.time(int(now * 1e9))
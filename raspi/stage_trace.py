@@ -0,0 +1,131 @@
+import collections
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Tracing per tahap siklus (format Chrome trace / Perfetto)
+# =========================
+# TRACE_ENABLED   : 1 = rekam span (default 0; saat nonaktif span() hanya return objek no-op)
+# TRACE_BUFFER    : jumlah span maksimum di ring memori (span tertua dibuang)
+# TRACE_DUMP_DIR  : folder tujuan dump saat menerima SIGUSR1
+# TRACE_HTTP_PORT : >0 = GET http://TRACE_HTTP_HOST:port/trace mengembalikan trace JSON
+# File hasil dump dibuka di https://ui.perfetto.dev atau chrome://tracing.
+TRACE_ENABLED   = os.getenv("TRACE_ENABLED", "0") == "1"
+TRACE_BUFFER    = int(os.getenv("TRACE_BUFFER", "20000"))
+TRACE_DUMP_DIR  = os.getenv("TRACE_DUMP_DIR", ".")
+TRACE_HTTP_HOST = os.getenv("TRACE_HTTP_HOST", "127.0.0.1")
+TRACE_HTTP_PORT = int(os.getenv("TRACE_HTTP_PORT", "0"))
+
+# (nama, kategori, mulai ns perf_counter, durasi ns, thread id, args)
+_spans = collections.deque(maxlen=max(1, TRACE_BUFFER))
+_thread_names = {}
+# Konversi perf_counter -> waktu epoch supaya span bisa dicocokkan dengan log/Influx
+_EPOCH_OFFSET_NS = time.time_ns() - time.perf_counter_ns()
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "start")
+
+    def __init__(self, name: str, cat: str, args: dict):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        tid = threading.get_ident()
+        if tid not in _thread_names:
+            _thread_names[tid] = threading.current_thread().name
+        if exc_type is not None:
+            self.args = dict(self.args, error=f"{exc_type.__name__}: {exc}")
+        _spans.append((self.name, self.cat, self.start, end - self.start, tid, self.args))
+        return False
+
+
+def span(name: str, cat: str = "cycle", **args):
+    """Context manager untuk satu tahap; no-op jika TRACE_ENABLED tidak aktif."""
+    if not TRACE_ENABLED:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+
+# =========================
+# Export
+# =========================
+def chrome_trace() -> dict:
+    """Isi ring sebagai dict format Chrome trace (event 'X' + nama thread)."""
+    pid = os.getpid()
+    events = [
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+        for tid, name in list(_thread_names.items())
+    ]
+    for name, cat, start, dur, tid, args in list(_spans):
+        events.append({
+            "name": name, "cat": cat, "ph": "X", "pid": pid, "tid": tid,
+            "ts": (start + _EPOCH_OFFSET_NS) / 1000, "dur": dur / 1000, "args": args,
+        })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def dump(path: str | None = None) -> str:
+    if path is None:
+        path = os.path.join(TRACE_DUMP_DIR, time.strftime("trace_%Y%m%d_%H%M%S.json"))
+    with open(path, "w") as f:
+        json.dump(chrome_trace(), f)
+    log.info(f"[Trace] {len(_spans)} span ditulis ke {path}")
+    return path
+
+
+class _TraceHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/trace":
+            self.send_error(404)
+            return
+        body = json.dumps(chrome_trace()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Disposition", "attachment; filename=trace.json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(f"[Trace] HTTP {self.address_string()} {format % args}")
+
+
+def install_from_env():
+    """Pasang pemicu dump (SIGUSR1 & HTTP) jika tracing aktif."""
+    if not TRACE_ENABLED:
+        return
+    log.info(f"[Trace] Tracing aktif (ring {TRACE_BUFFER} span). Dump: kill -USR1 {os.getpid()}")
+    if hasattr(signal, "SIGUSR1"):
+        # Dump dikerjakan di thread lain supaya handler sinyal tidak memblok thread utama
+        signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(target=dump, daemon=True).start())
+    if TRACE_HTTP_PORT > 0:
+        server = ThreadingHTTPServer((TRACE_HTTP_HOST, TRACE_HTTP_PORT), _TraceHandler)
+        threading.Thread(target=server.serve_forever, name="trace-http", daemon=True).start()
+        log.info(f"[Trace] Trace JSON tersedia di http://{TRACE_HTTP_HOST}:{TRACE_HTTP_PORT}/trace")
@@ -0,0 +1,135 @@
+import atexit
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+from batch_summary import BatchAccumulator
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Checkpoint state deteksi perubahan (warm start setelah restart)
+# =========================
+# Per mesin disimpan snapshot siklus terakhir (previous_values: process, batch, machine_on, ...),
+# interval downtime yang masih terbuka, dan akumulator batch_summary. Saat start, state ini
+# dipulihkan supaya siklus pertama hanya menulis field yang benar-benar berubah selama collector
+# mati, dan transisi (mis. proses selesai) yang terjadi selama itu tetap terdeteksi.
+#
+# STATE_FILE         : path file JSON checkpoint (default per skrip; kosong = nonaktif)
+# STATE_CHECKPOINT_S : interval checkpoint berkala (detik); juga ditulis saat shutdown
+#                      dan segera setelah siklus yang memicu action rule
+# STATE_MAX_AGE_S    : checkpoint lebih tua dari ini diabaikan (cold start); 0 = tanpa batas
+STATE_FILE         = os.getenv("STATE_FILE")
+STATE_CHECKPOINT_S = float(os.getenv("STATE_CHECKPOINT_S", "60"))
+STATE_MAX_AGE_S    = float(os.getenv("STATE_MAX_AGE_S", "86400"))
+
+STATE_VERSION = 1
+
+
+class StateStore:
+    """Simpan & pulihkan state per mesin (dict dari new_machine_state) ke satu file JSON."""
+
+    def __init__(self, path: str, max_age_s: float = STATE_MAX_AGE_S):
+        self.path = path
+        self.max_age_s = max_age_s
+        self._states = {}               # noMc -> dict state milik thread reader
+        self._save_lock = threading.Lock()
+        self._save_requested = threading.Event()
+        self._saved = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            log.info(f"[State] Belum ada checkpoint di {self.path}, cold start.")
+            return {}
+        except (OSError, ValueError) as e:
+            log.warning(f"[State] Checkpoint {self.path} tidak bisa dibaca ({e}), cold start.")
+            return {}
+        if data.get("version") != STATE_VERSION:
+            log.warning(f"[State] Versi checkpoint {data.get('version')} tidak dikenal, cold start.")
+            return {}
+        return data.get("machines", {})
+
+    def restore(self, no_mc, state: dict) -> bool:
+        """Isi state dari checkpoint (jika ada & belum kedaluwarsa) lalu ikutkan di checkpoint berikutnya."""
+        self._states[no_mc] = state
+        snap = self._saved.pop(str(no_mc), None)
+        if snap is None:
+            return False
+        age = time.time() - snap.get("saved_at", 0)
+        if self.max_age_s > 0 and age > self.max_age_s:
+            log.info(f"[State MC-{no_mc}] Checkpoint berumur {age / 3600:.1f} jam diabaikan, cold start.")
+            return False
+        state["previous_values"] = snap.get("previous_values", {})
+        state["downtime"].restore(snap.get("downtime", {}))
+        batch_acc = snap.get("batch_acc")
+        state["batch_acc"] = BatchAccumulator.from_snapshot(batch_acc) if batch_acc else None
+        log.info(f"[State MC-{no_mc}] Warm start dari checkpoint {age:.0f} detik lalu "
+                 f"(process={state['previous_values'].get('process')}, "
+                 f"batch='{state['previous_values'].get('batch', '')}').")
+        return True
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        machines = {}
+        for no_mc, state in list(self._states.items()):
+            # previous_values diganti (bukan dimutasi) tiap siklus, jadi aman dibaca dari thread lain
+            batch_acc = state["batch_acc"]
+            machines[str(no_mc)] = {
+                "saved_at": now,
+                "previous_values": state["previous_values"],
+                "downtime": state["downtime"].snapshot(),
+                "batch_acc": batch_acc.snapshot() if batch_acc is not None else None,
+            }
+        # Mesin yang checkpoint-nya belum dipulihkan (thread belum jalan) tetap disimpan
+        for key, snap in list(self._saved.items()):
+            machines.setdefault(key, snap)
+        return {"version": STATE_VERSION, "saved_at": now, "machines": machines}
+
+    def save(self):
+        """Tulis checkpoint secara atomik (file sementara + os.replace)."""
+        with self._save_lock:
+            data = self.snapshot()
+            tmp = f"{self.path}.tmp"
+            try:
+                with open(tmp, "w") as f:
+                    json.dump(data, f, separators=(",", ":"))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+            except OSError as e:
+                log.error(f"[State] Gagal menulis checkpoint {self.path}: {e}")
+                return
+        log.debug(f"[State] Checkpoint {len(data['machines'])} mesin ditulis ke {self.path}")
+
+    def request_save(self):
+        """Minta checkpoint secepatnya; ditulis oleh thread checkpoint, bukan thread pemanggil."""
+        self._save_requested.set()
+
+    def _checkpoint_loop(self, interval: float):
+        while True:
+            self._save_requested.wait(interval)
+            self._save_requested.clear()
+            self.save()
+
+    def start(self, interval: float = STATE_CHECKPOINT_S):
+        """Checkpoint berkala di thread terpisah + sekali lagi saat proses berhenti (exit/SIGTERM)."""
+        threading.Thread(target=self._checkpoint_loop, args=(interval,), name="state-checkpoint", daemon=True).start()
+        atexit.register(self.save)
+        # systemd stop mengirim SIGTERM: ubah jadi exit normal supaya atexit sempat berjalan
+        if signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        log.info(f"[State] Checkpoint tiap {interval:.0f} detik ke {self.path}")
+
+
+def open_state_store(default_path: str) -> StateStore | None:
+    path = default_path if STATE_FILE is None else STATE_FILE
+    if not path:
+        return None
+    return StateStore(path)
@@ -0,0 +1,44 @@
+"""Flag anomali hanya dievaluasi jika jendela berisi cukup sampel nyata (bukan NaN).
+
+Jalankan dari folder raspi:  python -m pytest -q test_anomaly_stats.py
+"""
+from anomaly_stats import FleetStats
+
+DIVERGENT = {"temp1": 700, "temp2": 500, "ph": 70, "machine_on": 1}   # selisih 20 °C
+NORMAL = {"temp1": 600, "temp2": 600, "ph": 70, "machine_on": 1}
+
+
+def run(fleet: FleetStats, values: dict | None, ticks: int, start: float) -> list:
+    """ticks tick berurutan @ 5 detik; values None = mesin tidak terbaca (slot NaN)."""
+    points = []
+    for k in range(ticks):
+        if values is not None:
+            fleet.stage(1, values)
+        points.extend(fleet.tick(start + k * 5))
+    return points
+
+
+def test_no_flag_until_min_valid_samples():
+    fleet = FleetStats([1], window=10, min_samples=5)
+    assert run(fleet, DIVERGENT, 4, 0) == []
+    points = run(fleet, DIVERGENT, 1, 20)
+    assert len(points) == 1
+    assert points[0]._tags["anomaly"] == "temp_divergence"
+    assert points[0]._fields["active"] == 1 and points[0]._fields["samples"] == 5
+
+
+def test_no_transition_from_thin_window_after_outage():
+    fleet = FleetStats([1], window=10, min_samples=5)
+    run(fleet, DIVERGENT, 10, 0)
+    assert fleet.active[0, 0]
+
+    # Putus 8 tick: jendela tinggal 2 sampel nyata, lalu mesin kembali normal
+    run(fleet, None, 8, 50)
+    points = run(fleet, NORMAL, 2, 90)
+    assert points == [] and fleet.active[0, 0]
+    assert fleet.stats["n"][0] == 2
+
+    # Setelah sampel nyata cukup, anomali selesai dari statistik jendela yang tidak tipis
+    points = run(fleet, NORMAL, 10, 100)
+    assert [p._fields["active"] for p in points] == [0]
+    assert points[0]._fields["samples"] >= 5
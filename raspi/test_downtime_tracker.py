@@ -0,0 +1,82 @@
+"""Interval downtime_intervals tetap konsisten walau tulis InfluxDB gagal.
+
+Jalankan dari folder raspi:  python -m pytest -q test_downtime_tracker.py
+"""
+import logging
+
+from collector_pipeline import CollectorPipeline
+from downtime_tracker import DOWNTIME_MIN_SECONDS, DowntimeTracker
+
+
+class FlakyWriteApi:
+    """Pengganti write_api: simpan record downtime; fail_next=True menggagalkan tulis berikutnya."""
+
+    def __init__(self):
+        self.fail_next = False
+        self.downtime = []
+
+    def write(self, bucket, record):
+        if self.fail_next:
+            self.fail_next = False
+            raise ConnectionError("InfluxDB tidak terjangkau")
+        if getattr(record, "_name", None) == "downtime_intervals":
+            self.downtime.append(dict(record._fields))
+
+
+def make_pipeline() -> tuple[CollectorPipeline, FlakyWriteApi]:
+    write_api = FlakyWriteApi()
+    pipeline = CollectorPipeline(write_api, "test", [], [], None, None, 1.0, logging.getLogger("test"))
+    return pipeline, write_api
+
+
+def cycle(pipeline, state, now, machine_on, reason):
+    pipeline.process_cycle(1, state, {"machine_on": machine_on, "ket_mesin_off": reason}, now)
+
+
+def test_close_is_rewritten_after_failed_write_on_reason_change():
+    pipeline, write_api = make_pipeline()
+    state = pipeline.new_machine_state(1)
+    t0 = 1_700_000_000
+    cycle(pipeline, state, t0, 0, 2)
+    cycle(pipeline, state, t0 + DOWNTIME_MIN_SECONDS, 0, 2)
+    assert write_api.downtime == [
+        {"start": t0, "end": 0, "duration_minute": DOWNTIME_MIN_SECONDS / 60, "status_code": 2, "open": 1},
+    ]
+
+    # Keterangan berganti tepat saat InfluxDB gagal: record penutup interval lama tidak boleh hilang
+    t1 = t0 + DOWNTIME_MIN_SECONDS + 60
+    write_api.fail_next = True
+    try:
+        cycle(pipeline, state, t1, 0, 5)
+    except ConnectionError:
+        pass
+    assert len(write_api.downtime) == 1
+
+    cycle(pipeline, state, t1 + 1, 0, 5)
+    assert write_api.downtime[1:] == [
+        {"start": t0, "end": t1, "duration_minute": round((t1 - t0) / 60.0, 2), "status_code": 2, "open": 0},
+    ]
+    assert state["downtime"].pending == []
+
+    # Interval baru (keterangan 5) tetap berjalan seperti biasa
+    cycle(pipeline, state, t1 + DOWNTIME_MIN_SECONDS, 0, 5)
+    assert write_api.downtime[-1] == \
+        {"start": t1, "end": 0, "duration_minute": DOWNTIME_MIN_SECONDS / 60, "status_code": 5, "open": 1}
+
+
+def test_pending_records_survive_checkpoint():
+    tracker = DowntimeTracker(1)
+    t0 = 1_700_000_000
+    tracker.update(False, 2, t0)
+    tracker.update(False, 2, t0 + DOWNTIME_MIN_SECONDS)
+    tracker.update(True, 0, t0 + DOWNTIME_MIN_SECONDS + 10)
+    assert [record[3] for record in tracker.pending] == [False, True]
+
+    restored = DowntimeTracker(1)
+    restored.restore(tracker.snapshot())
+    rows = restored.update(True, 0, t0 + DOWNTIME_MIN_SECONDS + 20)
+    assert [point.to_line_protocol() for _, point in rows] == \
+        [point.to_line_protocol() for _, point in tracker.update(True, 0, t0 + DOWNTIME_MIN_SECONDS + 20)]
+    for record, _ in rows:
+        restored.sent(record)
+    assert restored.pending == []
@@ -0,0 +1,240 @@
+"""Frame modbus_lite / modbus_gateway dibandingkan dengan framer pymodbus (acuan).
+
+Jalankan dari folder raspi:  python -m pytest -q test_modbus_lite.py
+"""
+import random
+
+import pytest
+from pymodbus.framer import FramerRTU, FramerSocket
+from pymodbus.pdu import DecodePDU, ExceptionResponse
+from pymodbus.pdu.register_message import (
+    ReadHoldingRegistersRequest, ReadHoldingRegistersResponse,
+    WriteMultipleRegistersRequest, WriteMultipleRegistersResponse,
+    WriteSingleRegisterRequest, WriteSingleRegisterResponse,
+)
+
+from modbus_gateway import TcpEndpoint
+from modbus_lite import CRC, RtuClient, crc16
+
+RTU = FramerRTU(DecodePDU(False))
+TCP = FramerSocket(DecodePDU(False))
+
+# Termasuk word >= 0x8000 supaya salah tanda/urutan byte ikut tertangkap
+REGISTERS = [0x0000, 0x0001, 0x1234, 0x7FFF, 0x8000, 0xABCD, 0xFFFF]
+
+
+# =========================
+# Transport palsu
+# =========================
+class FakeSerial:
+    """Pengganti serial.Serial: catat frame yang ditulis, jawab dari antrean respon."""
+
+    def __init__(self, responses):
+        self.timeout = 1.0
+        self.written = []
+        self._rx = b""
+        self._responses = list(responses)
+
+    def reset_input_buffer(self):
+        self._rx = b""
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        self._rx = self._responses.pop(0) if self._responses else b""
+
+    def read(self, size):
+        data, self._rx = self._rx[:size], self._rx[size:]
+        return data
+
+
+class FakeSocket:
+    """Pengganti socket TCP: respon untuk tiap request dibangun dari PDU yang dikirim."""
+
+    def __init__(self, respond):
+        self.sent = []
+        self._rx = b""
+        self._respond = respond
+
+    def sendall(self, data):
+        data = bytes(data)
+        self.sent.append(data)
+        self._rx += self._respond(data)
+
+    def recv_into(self, view):
+        n = min(len(view), len(self._rx))
+        view[:n] = self._rx[:n]
+        self._rx = self._rx[n:]
+        return n
+
+    def close(self):
+        pass
+
+
+def rtu_client(responses) -> tuple[RtuClient, FakeSerial]:
+    client = RtuClient("/dev/null", baudrate=115200, retries=0)
+    client._serial = FakeSerial(responses)
+    return client, client._serial
+
+
+# =========================
+# CRC
+# =========================
+def test_crc16_matches_pymodbus():
+    rng = random.Random(1)
+    for size in (1, 2, 6, 7, 64, 253):
+        data = bytes(rng.randrange(256) for _ in range(size))
+        # CRC Modbus dikirim low byte dulu; pymodbus mengembalikan nilai yang sudah ditukar byte-nya
+        assert CRC.pack(crc16(data)) == FramerRTU.compute_CRC(data).to_bytes(2, "big")
+        assert crc16(memoryview(data + b"\x00\x00"), size) == crc16(data)
+
+
+# =========================
+# RTU
+# =========================
+def test_rtu_read_frames_match_pymodbus():
+    response = ReadHoldingRegistersResponse(registers=REGISTERS, dev_id=5)
+    client, ser = rtu_client([RTU.buildFrame(response)])
+    out = [None] * (len(REGISTERS) + 2)
+    assert client.read_holding_registers_into(4100, len(REGISTERS), out, 2, slave=5) == 0
+    assert ser.written == [RTU.buildFrame(ReadHoldingRegistersRequest(address=4100, count=len(REGISTERS), dev_id=5))]
+    assert out == [None, None] + REGISTERS
+
+
+def test_rtu_read_exception_response():
+    exception = ExceptionResponse(0x03, 0x02, slave=5)
+    client, _ = rtu_client([RTU.buildFrame(exception)] * 2)
+    out = [0] * 3
+    assert client.read_holding_registers_into(100, 3, out, slave=5) == 0x02
+    assert out == [0, 0, 0]
+    resp = client.read_holding_registers(100, 3, slave=5)
+    assert resp.isError() and resp.exception_code == 0x02
+
+
+def test_rtu_write_frames_match_pymodbus():
+    single = WriteSingleRegisterResponse(address=10, registers=[0xABCD], dev_id=3)
+    multi = WriteMultipleRegistersResponse(address=20, count=len(REGISTERS), dev_id=3)
+    client, ser = rtu_client([RTU.buildFrame(single), RTU.buildFrame(multi)])
+    assert not client.write_register(10, 0xABCD, slave=3).isError()
+    assert not client.write_registers(20, REGISTERS, slave=3).isError()
+    assert ser.written == [
+        RTU.buildFrame(WriteSingleRegisterRequest(address=10, registers=[0xABCD], dev_id=3)),
+        RTU.buildFrame(WriteMultipleRegistersRequest(address=20, registers=REGISTERS, dev_id=3)),
+    ]
+
+
+def test_rtu_write_exception_response():
+    exception = ExceptionResponse(0x10, 0x04, slave=3)
+    client, _ = rtu_client([RTU.buildFrame(exception)])
+    resp = client.write_registers(20, [1, 2], slave=3)
+    assert resp.isError() and resp.exception_code == 0x04
+
+
+def test_rtu_rejects_bad_crc_and_unit():
+    frame = bytearray(RTU.buildFrame(ReadHoldingRegistersResponse(registers=[1, 2], dev_id=5)))
+    frame[-1] ^= 0xFF
+    other_unit = RTU.buildFrame(ReadHoldingRegistersResponse(registers=[1, 2], dev_id=6))
+    client, _ = rtu_client([bytes(frame), other_unit])
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            client.read_holding_registers_into(100, 2, [0, 0], slave=5)
+
+
+# =========================
+# TCP (MBAP)
+# =========================
+def tcp_endpoint(respond) -> tuple[TcpEndpoint, FakeSocket]:
+    endpoint = TcpEndpoint("127.0.0.1", 502)
+    endpoint._sock = FakeSocket(respond)
+    return endpoint, endpoint._sock
+
+
+def test_tcp_read_frames_match_pymodbus():
+    blocks = ((100, 1), (4100, len(REGISTERS)))
+    store = {100: [0x8001], 4100: REGISTERS}
+
+    def respond(request):
+        tid, unit, fc = int.from_bytes(request[:2], "big"), request[6], request[7]
+        address, count = int.from_bytes(request[8:10], "big"), int.from_bytes(request[10:12], "big")
+        assert fc == 0x03
+        return TCP.buildFrame(ReadHoldingRegistersResponse(registers=store[address][:count], dev_id=unit, transaction_id=tid))
+
+    endpoint, sock = tcp_endpoint(respond)
+    out = [0] * 8
+    endpoint.read_holding_blocks_into(7, blocks, out)
+    assert out == [0x8001] + REGISTERS
+    assert sock.sent == [
+        TCP.buildFrame(ReadHoldingRegistersRequest(address=address, count=count, dev_id=7, transaction_id=tid))
+        for tid, (address, count) in enumerate(blocks, start=1)
+    ]
+
+
+def test_tcp_exception_response():
+    def respond(request):
+        tid = int.from_bytes(request[:2], "big")
+        return TCP.buildFrame(ExceptionResponse(0x03, 0x02, slave=request[6], transaction=tid))
+
+    endpoint, _ = tcp_endpoint(respond)
+    with pytest.raises(ConnectionError, match="exception 2 @ 100"):
+        endpoint.read_holding_blocks_into(7, ((100, 2),), [0, 0])
+
+
+def test_tcp_write_frames_match_pymodbus():
+    def respond(request):
+        tid, unit, fc = int.from_bytes(request[:2], "big"), request[6], request[7]
+        if fc == 0x06:
+            return TCP.buildFrame(WriteSingleRegisterResponse(address=10, registers=[0xABCD], dev_id=unit, transaction_id=tid))
+        return TCP.buildFrame(ExceptionResponse(0x10, 0x04, slave=unit, transaction=tid))
+
+    endpoint, sock = tcp_endpoint(respond)
+    endpoint.write_register(3, 10, 0xABCD)
+    with pytest.raises(ConnectionError, match="Exception Modbus 4"):
+        endpoint.write_registers(3, 20, REGISTERS)
+    assert sock.sent == [
+        TCP.buildFrame(WriteSingleRegisterRequest(address=10, registers=[0xABCD], dev_id=3, transaction_id=1)),
+        TCP.buildFrame(WriteMultipleRegistersRequest(address=20, registers=REGISTERS, dev_id=3, transaction_id=2)),
+    ]
+
+
+def test_tcp_rejects_response_from_other_unit():
+    def respond(request):
+        tid = int.from_bytes(request[:2], "big")
+        return TCP.buildFrame(ReadHoldingRegistersResponse(registers=[1, 2], dev_id=request[6] + 1, transaction_id=tid))
+
+    endpoint, _ = tcp_endpoint(respond)
+    with pytest.raises(ConnectionError, match="Unit respon MBAP 8"):
+        endpoint.read_holding_blocks_into(7, ((100, 2),), [0, 0])
+    # Stream dianggap tidak sinkron: socket ditutup, dibuka ulang di request berikutnya
+    assert endpoint._sock is None
+
+
+def test_tcp_rejects_pdu_shorter_than_byte_count():
+    responses = []
+
+    def respond(request):
+        tid = int.from_bytes(request[:2], "big")
+        if not responses:
+            responses.append(tid)
+            return TCP.buildFrame(ReadHoldingRegistersResponse(registers=[0x1234, 0x5678], dev_id=7, transaction_id=tid))
+        # MBAP length 3 (unit, fc, byte count) padahal byte count 4: register-nya tidak ikut terkirim
+        return tid.to_bytes(2, "big") + bytes([0, 0, 0, 3, 7, 0x03, 4])
+
+    endpoint, _ = tcp_endpoint(respond)
+    out = [0, 0]
+    endpoint.read_holding_blocks_into(7, ((100, 2),), out)
+    assert out == [0x1234, 0x5678]
+    out = [0, 0]
+    # Sisa respon sebelumnya di buffer terima tidak boleh terbaca sebagai data perangkat
+    with pytest.raises(ConnectionError, match="kurang dari 6 byte"):
+        endpoint.read_holding_blocks_into(7, ((100, 2),), out)
+    assert out == [0, 0]
+    assert endpoint._sock is None
+
+
+def test_tcp_rejects_truncated_write_response():
+    def respond(request):
+        tid = int.from_bytes(request[:2], "big")
+        return tid.to_bytes(2, "big") + bytes([0, 0, 0, 3, 3, 0x06, 0])
+
+    endpoint, _ = tcp_endpoint(respond)
+    with pytest.raises(ConnectionError, match="kurang dari 5 byte"):
+        endpoint.write_register(3, 10, 0xABCD)